@@ -0,0 +1,117 @@
+"""Count Bot API calls per user flow and check them against the expected numbers.
+
+Walks a user through signing up, viewing the schedule and cancelling,
+and an admin through changing an event's time, by feeding updates to the
+application built by bot.build_application. OfflineRequest counts every
+Bot API call, including admin notifications. Each flow runs twice:
+- with the chat's reply keyboard state kept, as in production;
+- with that state forgotten before every update, so every handler that
+  shows the main menu sends it again, close to the bot before it tracked
+  the state.
+
+Exits with status 1 if a flow's calls differ from EXPECTED_CALLS.
+
+    python -m benchmarks.bench_api_calls
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_api_calls.db")
+os.environ["ADMIN_IDS"] = "1000"
+os.environ["NOTIFY_CHAT_INTERVAL"] = "0"
+
+ADMIN_ID, USER_ID = 1000, 2000
+# Bot API calls per flow with the keyboard state kept, from the first visit on.
+EXPECTED_CALLS = {
+    "start": 1,
+    "participate": 5,  # day, event and role keyboards, confirmation, admin notification
+    "schedule": 1,
+    "cancel": 3,  # list, confirmation, admin notification
+    "admin edit time": 4,
+}
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    from bot import build_application
+    from benchmarks.offline import OfflineRequest, message_update, callback_update
+    from db_setup import DEFAULT_TENANT_ID, event_roles, default_engine
+    from service.schedule_service import ensure_week_events, get_week_schedule
+    from shared.notifications import flush_notifications
+
+    ensure_week_events(DEFAULT_TENANT_ID)
+    with default_engine().begin() as conn:
+        conn.execute(event_roles.update().values(capacity=None))
+    event = get_week_schedule(DEFAULT_TENANT_ID)[0]
+    request = OfflineRequest()
+    builder = ApplicationBuilder().token("123456:offline").request(request).get_updates_request(OfflineRequest())
+    app = build_application(builder)
+    update_ids = iter(range(1, 10 ** 9))
+
+    def flows():
+        start = message_update(next(update_ids), USER_ID, "/start")
+        start["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": 6}]
+        return {
+            "start": [start],
+            "participate": [
+                message_update(next(update_ids), USER_ID, "Участвовать"),
+                callback_update(next(update_ids), USER_ID, f"chooseday|{event.date}"),
+                callback_update(next(update_ids), USER_ID, f"chooseevent|{event.id}"),
+                callback_update(next(update_ids), USER_ID, f"chooserole|{event.roles[0].id}"),
+            ],
+            "schedule": [message_update(next(update_ids), USER_ID, "Расписание")],
+            "cancel": [
+                message_update(next(update_ids), USER_ID, "Отменить участие"),
+                callback_update(next(update_ids), USER_ID, "cancelall"),
+            ],
+            "admin edit time": [
+                message_update(next(update_ids), ADMIN_ID, "Редактировать события"),
+                callback_update(next(update_ids), ADMIN_ID, f"manageevent|{event.id}"),
+                callback_update(next(update_ids), ADMIN_ID, "edittime"),
+                message_update(next(update_ids), ADMIN_ID, "09:15"),
+            ],
+        }
+
+    async def walk(forget_keyboard):
+        counts = {}
+        for name, payloads in flows().items():
+            before = sum(request.calls.values())
+            for payload in payloads:
+                update = Update.de_json(payload, app.bot)
+                if forget_keyboard:
+                    app.chat_data[update.effective_chat.id].pop("menu_keyboard", None)
+                await app.process_update(update)
+            await flush_notifications()
+            counts[name] = sum(request.calls.values()) - before
+        return counts
+
+    async with app:
+        for _ in range(args.warmup):
+            await walk(False)
+        kept = await walk(False)
+        forgotten = await walk(True)
+
+    failures = []
+    print(f"{'flow':<18}{'kept':>6}{'forgotten':>11}{'expected':>10}")
+    for name, expected in EXPECTED_CALLS.items():
+        print(f"{name:<18}{kept[name]:>6}{forgotten[name]:>11}{expected:>10}")
+        if kept[name] != expected:
+            failures.append(name)
+    print(f"{'total':<18}{sum(kept.values()):>6}{sum(forgotten.values()):>11}{sum(EXPECTED_CALLS.values()):>10}")
+    if failures:
+        print(f"FAIL: unexpected number of Bot API calls in {', '.join(failures)}")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--warmup", type=int, default=1, help="walks before counting, so the keyboards are shown")
+    args = parser.parse_args()
+    from db_setup import init_db
+    init_db()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compare the /stats report read from the aggregates with the same figures scanned from history.
+
+Seeds growing amounts of history, rebuilds the aggregates from it in
+chunks as `python -m db.attendance` does, then times the report built
+from the aggregate tables against equivalent GROUP BY queries over
+events and participations.
+
+    python -m benchmarks.bench_attendance --years 1 2 5 --users 300 --per-event 8
+"""
+import os
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import date, timedelta
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_attendance.db")
+
+from benchmarks.offline import seed_history
+
+def scan_report(session, tenant_id, since):
+    """The report's figures computed from events and participations on every call."""
+    from sqlalchemy import func, select
+    from db_setup import Event, Participation, event_roles
+    users = session.execute(
+        select(Participation.username, func.strftime("%Y-%m", Event.date), func.count())
+        .join(Event, Event.id == Participation.event_id)
+        .where(Event.tenant_id == tenant_id, Event.date >= since)
+        .group_by(Participation.username, func.strftime("%Y-%m", Event.date))
+    ).all()
+    signups = (
+        select(Participation.event_id, Participation.role_id, func.count().label("n"))
+        .group_by(Participation.event_id, Participation.role_id)
+        .subquery()
+    )
+    roles = session.execute(
+        select(func.strftime("%w", Event.date), event_roles.c.role_id, func.count(), func.count(signups.c.n))
+        .join(event_roles, event_roles.c.event_id == Event.id)
+        .outerjoin(signups, (signups.c.event_id == Event.id) & (signups.c.role_id == event_roles.c.role_id))
+        .where(Event.tenant_id == tenant_id, Event.date >= since)
+        .group_by(func.strftime("%w", Event.date), event_roles.c.role_id)
+    ).all()
+    return users, roles
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 2, 5])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--per-event", type=int, default=8)
+    parser.add_argument("--months", type=int, default=3, help="months the report covers")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    from db_setup import DEFAULT_TENANT_ID, init_db
+    from db.attendance import ATTENDANCE_BACKFILL_CHUNK, rebuild_attendance
+    from db.context import db_session
+    from service.attendance import attendance_report, report_start
+    init_db()  # seeds the default roles 1-3 the events below offer
+    today = date.today()
+    since = report_start(today, args.months)
+    print(f"report over {args.months} months, backfill chunks of {ATTENDANCE_BACKFILL_CHUNK} events")
+    print(f"  {'history':<10}{'rebuild s':>10}{'report ms':>11}{'scan ms':>9}{'full scan ms':>14}")
+    seeded_from = today + timedelta(days=7)
+    for years in sorted(args.years):
+        start = today - timedelta(days=365 * years)
+        seed_history(start, (seeded_from - start).days, args.users, args.per_event)
+        seeded_from = start
+        started = time.perf_counter()
+        rebuild_attendance()
+        rebuild = time.perf_counter() - started
+        report = timed(lambda: attendance_report(DEFAULT_TENANT_ID, today, args.months), args.runs)
+        with db_session() as session:
+            scan = timed(lambda: scan_report(session, DEFAULT_TENANT_ID, since), args.runs)
+            full = timed(lambda: scan_report(session, DEFAULT_TENANT_ID, start), max(1, args.runs // 4))
+        print(f"  {f'{years} years':<10}{rebuild:>10.2f}{report:>11.2f}{scan:>9.2f}{full:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Check that one busy user does not delay other users' updates.
+
+With a few concurrent update slots, one user sends a burst of messages to
+a slow handler and types a few inline queries. Then another user sends
+one message. OrderedApplication must still handle the busy user's
+messages in order, answer their inline queries without waiting for those
+messages, and handle the other user's message without waiting. For
+comparison the same run uses the earlier approach: a per-user lock taken
+after the update already holds a slot.
+
+Exits with status 1 if OrderedApplication breaks the busy user's order, or
+if the other user's message or the inline queries wait longer than --limit.
+
+    python -m benchmarks.bench_busy_user --slots 4 --burst 6 --handler-delay 0.5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_busy_user.db")
+
+BUSY_ID, OTHER_ID = 1000, 2000
+
+def lock_in_slot_class():
+    from telegram import Update
+    from telegram.ext import Application
+
+    class LockInSlotApplication(Application):
+        """Per-(chat, user) lock awaited inside process_update, while the update holds a slot."""
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self._locks = {}
+
+        async def process_update(self, update):
+            if not isinstance(update, Update):
+                return await super().process_update(update)
+            key = (
+                update.effective_chat.id if update.effective_chat else None,
+                update.effective_user.id if update.effective_user else None,
+            )
+            async with self._locks.setdefault(key, asyncio.Lock()):
+                await super().process_update(update)
+
+    return LockInSlotApplication
+
+async def run(application_class, args):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, InlineQueryHandler, MessageHandler, filters
+    from benchmarks.offline import OfflineRequest, inline_query_update, message_update
+
+    handled, finished = [], {}
+
+    async def on_message(update, context):
+        if update.effective_user.id == BUSY_ID:
+            await asyncio.sleep(args.handler_delay)
+        handled.append((update.effective_user.id, update.message.text))
+        finished[update.update_id] = time.perf_counter()
+
+    async def on_inline(update, context):
+        finished[update.update_id] = time.perf_counter()
+
+    app = (
+        ApplicationBuilder()
+        .token("123456:offline")
+        .request(OfflineRequest())
+        .get_updates_request(OfflineRequest())
+        .updater(None)
+        .application_class(application_class)
+        .concurrent_updates(args.slots)
+        .build()
+    )
+    app.add_handler(MessageHandler(filters.TEXT, on_message))
+    app.add_handler(InlineQueryHandler(on_inline))
+    update_ids = iter(range(1, 10 ** 9))
+    enqueued = {}
+
+    async def put(payload):
+        update = Update.de_json(payload, app.bot)
+        enqueued[update.update_id] = time.perf_counter()
+        await app.update_queue.put(update)
+        return update.update_id
+
+    async with app:
+        await app.start()
+        burst = [await put(message_update(next(update_ids), BUSY_ID, str(n))) for n in range(args.burst)]
+        inline = [await put(inline_query_update(next(update_ids), BUSY_ID, "week"[:n + 1])) for n in range(4)]
+        other = await put(message_update(next(update_ids), OTHER_ID, "hello"))
+        await app.update_queue.join()
+        await app.stop()
+
+    waited = lambda update_id: finished[update_id] - enqueued[update_id]
+    in_order = [text for user_id, text in handled if user_id == BUSY_ID] == [str(n) for n in range(args.burst)]
+    return waited(other), max(waited(u) for u in inline), waited(burst[-1]), in_order
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slots", type=int, default=4, help="concurrent_updates")
+    parser.add_argument("--burst", type=int, default=6, help="messages the busy user sends at once")
+    parser.add_argument("--handler-delay", type=float, default=0.5, help="seconds per busy user's message")
+    parser.add_argument("--limit", type=float, default=0.1, help="seconds the other updates may wait")
+    args = parser.parse_args()
+    from bot import OrderedApplication
+
+    print(f"{args.slots} slots, busy user sends {args.burst} messages of {args.handler_delay} s and 4 inline queries")
+    print(f"  {'application':<24}{'other user s':>13}{'inline s':>10}{'last burst s':>14}{'in order':>10}")
+    results = {}
+    for name, cls in (("OrderedApplication", OrderedApplication), ("lock inside a slot", lock_in_slot_class())):
+        results[name] = other, inline, last, in_order = asyncio.run(run(cls, args))
+        print(f"  {name:<24}{other:>13.3f}{inline:>10.3f}{last:>14.3f}{str(in_order):>10}")
+    other, inline, _, in_order = results["OrderedApplication"]
+    if not in_order or other > args.limit or inline > args.limit:
+        print("FAIL: OrderedApplication delayed other updates or reordered the busy user's")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Count SQL statements and time per "cancel all" as a user's signups grow.
+
+Compares delete_upcoming_participations() with the previous ORM path
+(joinedload select, then session.delete() per row, which SQLAlchemy
+sends as one executemany). "execs" counts executemany parameter sets as
+separate executions. The current path runs the same five whatever the
+number of signups: the select, the delete, one UPDATE of the seats that
+also returns the roles left empty, and one UPDATE per attendance table.
+The legacy path keeps neither seats nor aggregates up to date. Exits
+with status 1 if its executions grow with the signups. Times are the
+median of --repeat runs. Run from the repository root:
+
+    python -m benchmarks.bench_cancel_all --signups 1 10 50 200
+"""
+import os
+import sys
+import time
+import statistics
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_cancel_all.db")
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import joinedload
+from db_setup import DEFAULT_TENANT_ID, Event, Participation, default_engine, init_db
+from db.context import db_session
+from db.queries import delete_upcoming_participations
+
+engine = default_engine()
+
+def legacy_delete_upcoming(session, username, today):
+    parts = (
+        session.query(Participation)
+        .options(joinedload(Participation.event), joinedload(Participation.role))
+        .join(Event)
+        .filter(Participation.username == username, Event.date >= today)
+        .order_by(Event.date, Event.slot)
+        .all()
+    )
+    for p in parts:
+        session.delete(p)
+    session.commit()
+    return parts
+
+def current_delete_upcoming(session, username, today):
+    return delete_upcoming_participations(session, DEFAULT_TENANT_ID, username, today)
+
+def seed(username: str, count: int):
+    with engine.begin() as conn:
+        conn.execute(insert(Participation), [
+            {"event_id": event_id, "role_id": 1, "username": username}
+            for event_id in range(1, count + 1)
+        ])
+
+def measure(func, username: str, count: int):
+    seed(username, count)
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        statements.append(len(parameters) if executemany else 1)
+
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with db_session() as session:
+            started = time.perf_counter()
+            deleted = func(session, username, date.today())
+            elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(deleted) == count, (len(deleted), count)
+    return len(statements), sum(statements), elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--signups", type=int, nargs="+", default=[1, 10, 50, 200])
+    parser.add_argument("--repeat", type=int, default=9)
+    args = parser.parse_args()
+    init_db()
+    events = max(args.signups)
+    with engine.begin() as conn:
+        # Role 1 is one of the default roles init_db() seeded.
+        conn.execute(insert(Event), [
+            {"date": date.today() + timedelta(days=d // 2), "slot": ("morning", "evening")[d % 2],
+             "name": "bench", "time": "08:00"}
+            for d in range(events)
+        ])
+    for func in (legacy_delete_upcoming, current_delete_upcoming):
+        measure(func, "warmup", 1)
+    print(f"  {'':>8}{'legacy':>24}{'current':>24}")
+    print(f"  {'signups':>8}" + f"{'stmts':>8}{'execs':>8}{'ms':>8}" * 2)
+    current_execs = set()
+    for count in args.signups:
+        results = {"legacy": [], "user": []}
+        for run in range(args.repeat):
+            # Alternate the two paths so both see the same database growth.
+            for name, func in (("legacy", legacy_delete_upcoming), ("user", current_delete_upcoming)):
+                results[name].append(measure(func, f"{name}{count}-{run}", count))
+        row = f"  {count:>8}"
+        for runs in results.values():
+            stmts, execs, _ = runs[0]
+            row += f"{stmts:>8}{execs:>8}{statistics.median(r[2] for r in runs) * 1000:>8.2f}"
+        current_execs.update(execs for _, execs, _ in results["user"])
+        print(row)
+    if len(current_execs) > 1:
+        print("FAIL: the current path's executions grow with the number of signups")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
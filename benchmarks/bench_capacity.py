@@ -0,0 +1,138 @@
+"""Stress role capacity with parallel signups and cancellations.
+
+Threads sign many users up for the same few event roles at once, and cancel
+some of the signups again, through the application's queries. Afterwards
+every role must hold at most its capacity, and its taken counter must equal
+its participations. Exits with status 1 if either check fails.
+
+    python -m benchmarks.bench_capacity --threads 16 --users 400 --capacity 5 --events 2
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_capacity.db")
+
+def prepare(events: int, capacity: int):
+    from sqlalchemy import select
+    from db_setup import DEFAULT_TENANT_ID, event_roles, init_db
+    from db.context import db_session
+    from db.queries import set_role_capacity
+    from service.schedule_service import ensure_week_events, get_week_schedule
+
+    init_db()
+    ensure_week_events(DEFAULT_TENANT_ID)
+    chosen = [e.id for e in get_week_schedule(DEFAULT_TENANT_ID)[:events]]
+    with db_session() as session:
+        pairs = session.execute(
+            select(event_roles.c.event_id, event_roles.c.role_id).where(event_roles.c.event_id.in_(chosen))
+        ).all()
+        for event_id, role_id in pairs:
+            set_role_capacity(session, DEFAULT_TENANT_ID, event_id, role_id, capacity)
+    return pairs
+
+def worker(n, args, pairs, barrier, outcomes, lock):
+    from sqlalchemy.exc import OperationalError
+    from db_setup import DEFAULT_TENANT_ID
+    from db.context import db_session
+    from db.queries import (
+        ALREADY_SIGNED_UP, ROLE_FULL, SIGNED_UP, add_participation, get_upcoming_participations,
+        delete_participation,
+    )
+    from datetime import date
+
+    names = {SIGNED_UP: "signed up", ALREADY_SIGNED_UP: "duplicate", ROLE_FULL: "full"}
+    rng = random.Random(n)
+    local = Counter()
+    barrier.wait()
+    for user in range(n, args.users, args.threads):
+        username = f"user{user}"
+        for _ in range(args.attempts):
+            event_id, role_id = rng.choice(pairs)
+            try:
+                with db_session() as session:
+                    local[names[add_participation(session, event_id, role_id, username)]] += 1
+                    if rng.random() < args.cancel_share:
+                        parts = get_upcoming_participations(session, DEFAULT_TENANT_ID, username, date.today())
+                        if parts and delete_participation(session, DEFAULT_TENANT_ID, rng.choice(parts).id, username):
+                            local["cancelled"] += 1
+            except OperationalError:
+                local["locked"] += 1
+    with lock:
+        outcomes.update(local)
+
+def check(pairs):
+    from sqlalchemy import func, select
+    from db_setup import Participation, event_roles
+    from db.context import db_session
+
+    with db_session() as session:
+        counts = dict(
+            ((event_id, role_id), count)
+            for event_id, role_id, count in session.execute(
+                select(Participation.event_id, Participation.role_id, func.count())
+                .group_by(Participation.event_id, Participation.role_id)
+            )
+        )
+        seats = session.execute(
+            select(event_roles.c.event_id, event_roles.c.role_id, event_roles.c.capacity, event_roles.c.taken)
+        ).all()
+    chosen = set(map(tuple, pairs))
+    over, drift, full = [], [], 0
+    for event_id, role_id, capacity, taken in seats:
+        count = counts.get((event_id, role_id), 0)
+        if capacity is not None and count > capacity:
+            over.append((event_id, role_id, count, capacity))
+        if taken != count:
+            drift.append((event_id, role_id, taken, count))
+        if (event_id, role_id) in chosen and count == capacity:
+            full += 1
+    return over, drift, full
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--attempts", type=int, default=3, help="signup attempts per user")
+    parser.add_argument("--capacity", type=int, default=5, help="seats per contended role")
+    parser.add_argument("--events", type=int, default=2, help="contended events")
+    parser.add_argument("--cancel-share", type=float, default=0.2)
+    parser.add_argument("--profile", default="production")
+    args = parser.parse_args()
+    os.environ["DB_PROFILE"] = args.profile
+    os.environ["DB_POOL_SIZE"] = str(args.threads)
+
+    pairs = prepare(args.events, args.capacity)
+    barrier = threading.Barrier(args.threads)
+    outcomes, lock = Counter(), threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(n, args, pairs, barrier, outcomes, lock))
+        for n in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    over, drift, full = check(pairs)
+
+    attempts = sum(outcomes[k] for k in ("signed up", "duplicate", "full", "locked"))
+    print(f"{args.threads} threads, {args.users} users, {len(pairs)} roles of {args.capacity} seats, "
+          f"profile {args.profile}")
+    print(f"  attempts:    {attempts} in {elapsed:.2f} s ({attempts / elapsed:.0f}/s)")
+    for key in ("signed up", "full", "duplicate", "cancelled", "locked"):
+        print(f"  {key + ':':<12} {outcomes[key]}")
+    print(f"  roles full at the end:    {full}/{len(pairs)}")
+    print(f"  roles over capacity:      {len(over)} {over[:5] if over else ''}")
+    print(f"  counters off their rows:  {len(drift)} {drift[:5] if drift else ''}")
+    if over or drift:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Measure per-user conversation state and check it survives a restart.
+
+Puts --users users through "Участвовать" -> day -> event, stops the
+application mid-conversation and compares the stored state with the
+previous layout, where user_data held the whole week of EventDTOs and the
+chosen EventDTO. A second application then resumes every conversation
+from the database and finishes the signup. Run from the repository root:
+
+    python -m benchmarks.bench_conversation_state --users 1000
+"""
+import os
+import json
+import pickle
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import dataclasses
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "conversation_state.db")
+
+def clone(value):
+    # Deep copy through constructors; frozen slotted DTOs cannot be unpickled on 3.11.
+    if dataclasses.is_dataclass(value):
+        return type(value)(*(clone(getattr(value, f.name)) for f in dataclasses.fields(value)))
+    if isinstance(value, dict):
+        return {clone(k): clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [clone(v) for v in value]
+    if isinstance(value, str):
+        return "".join(value)
+    return value
+
+def resident_bytes(states) -> int:
+    """Bytes allocated by a fresh, independent copy of every state (as loaded after a restart)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    copies = [clone(state) for state in states]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del copies
+    return used
+
+def seed_signups(events, per_event: int):
+    from sqlalchemy import insert
+    from db_setup import Participation, default_engine, event_roles, recount_seats
+    rows = [
+        {"event_id": e.id, "role_id": random.choice(e.roles).id, "username": f"seed{i}"}
+        for e in events
+        for i in range(per_event)
+    ]
+    with default_engine().begin() as conn:
+        # Every resumed conversation should be able to sign up; capacity is not measured here.
+        conn.execute(event_roles.update().values(capacity=None))
+        if rows:
+            conn.execute(insert(Participation), rows)
+    recount_seats()
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    from bot import build_application
+    from benchmarks.offline import OfflineRequest, message_update, callback_update
+    from db.context import db_session
+    from db_setup import DEFAULT_TENANT_ID, BotState, Participation
+    from service.schedule_service import ensure_week_events, get_week_schedule, invalidate_week_schedule
+
+    ensure_week_events(DEFAULT_TENANT_ID)
+    events = get_week_schedule(DEFAULT_TENANT_ID)
+    seed_signups(events, args.signups)
+    invalidate_week_schedule(DEFAULT_TENANT_ID, events[0].date)
+    events = get_week_schedule(DEFAULT_TENANT_ID)
+    next_id = iter(range(1, 10 ** 9))
+
+    def new_app():
+        builder = (
+            ApplicationBuilder()
+            .token("123456:offline")
+            .request(OfflineRequest())
+            .get_updates_request(OfflineRequest())
+        )
+        return build_application(builder)
+
+    async def feed(app, payloads):
+        for payload in payloads:
+            await app.process_update(Update.de_json(payload, app.bot))
+
+    users = [1000 + i for i in range(args.users)]
+    chosen = {user: random.choice(events) for user in users}
+
+    app = new_app()
+    async with app:
+        await asyncio.gather(*(feed(app, [
+            message_update(next(next_id), user, "Участвовать"),
+            callback_update(next(next_id), user, f"chooseday|{chosen[user].date}"),
+            callback_update(next(next_id), user, f"chooseevent|{chosen[user].id}"),
+        ]) for user in users))
+        compact = [dict(app.user_data[user]) for user in users]
+        await app.update_persistence()
+
+    week = {}
+    for e in events:
+        week.setdefault(e.date, {})[e.slot] = e
+    legacy = [
+        {"schedule": week, "chosen_date": chosen[user].date, "chosen_event": chosen[user]}
+        for user in users
+    ]
+    with db_session() as session:
+        rows = session.query(BotState.kind, BotState.data).all()
+
+    print(f"{args.users} conversations waiting for a role, {len(events)} events, "
+          f"{args.signups} signups per event")
+    print(f"  {'layout':<26}{'stored B/user':>14}{'resident B/user':>17}")
+    print(f"  {'week + EventDTO (pickle)':<26}"
+          f"{sum(len(pickle.dumps(s)) for s in legacy) / args.users:>14.0f}"
+          f"{resident_bytes(legacy) / args.users:>17.0f}")
+    print(f"  {'ids and dates (JSON)':<26}"
+          f"{sum(len(json.dumps(s, separators=(',', ':'))) for s in compact) / args.users:>14.0f}"
+          f"{resident_bytes(compact) / args.users:>17.0f}")
+    print(f"  bot_state rows: {len(rows)}, {sum(len(data) for _, data in rows)} bytes of JSON")
+
+    app = new_app()
+    async with app:
+        await asyncio.gather(*(feed(app, [
+            callback_update(next(next_id), user, f"chooserole|{chosen[user].roles[0].id}"),
+        ]) for user in users))
+        await app.update_persistence()
+    with db_session() as session:
+        resumed = session.query(Participation).filter(Participation.username.like("user%")).count()
+        left = session.query(BotState).filter(BotState.kind.like("conv:%")).count()
+    print(f"  resumed after restart: {resumed}/{args.users} signups, {left} open conversations")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--signups", type=int, default=5, help="existing signups per event")
+    args = parser.parse_args()
+    from db_setup import init_db
+    init_db()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
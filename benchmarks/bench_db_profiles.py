@@ -0,0 +1,108 @@
+"""Compare mixed read/write throughput of the engine profiles from get_engine().
+
+Worker threads, like the bot's db executor, run the week query and add
+signups in a given ratio against a fresh SQLite file per profile. The
+report shows operations per second, latency and "database is locked"
+errors. Run from the repository root:
+
+    python -m benchmarks.bench_db_profiles --threads 8 --seconds 5 --writes 20
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+from datetime import date, timedelta
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "unused.db")
+
+from benchmarks.offline import percentile
+
+PROFILES = ("default", "production")
+
+def seed(engine, days: int):
+    from sqlalchemy import insert
+    from db_setup import Base, Event, Role, event_roles
+    Base.metadata.create_all(bind=engine)
+    start = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(Role), [{"name": n} for n in ("Ведущий молитвы", "Хор", "Ритм")])
+        conn.execute(insert(Event), [
+            {"date": start + timedelta(days=d), "slot": slot, "name": slot, "time": "08:00"}
+            for d in range(days)
+            for slot in ("morning", "evening")
+        ])
+        conn.execute(insert(event_roles), [
+            {"event_id": e, "role_id": r} for e in range(1, days * 2 + 1) for r in (1, 2, 3)
+        ])
+    return [start + timedelta(days=d) for d in range(7)], days * 2
+
+def run_profile(profile: str, args):
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+    from db_setup import DEFAULT_TENANT_ID, get_engine
+    from db.queries import add_participation, get_events_for_dates
+
+    path = os.path.join(tempfile.mkdtemp(), f"{profile}.db")
+    engine = get_engine(profile, path)
+    dates, event_count = seed(engine, days=7)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    deadline = time.perf_counter() + args.seconds
+    lock = threading.Lock()
+    latencies = {"read": [], "write": []}
+    errors = {"locked": 0, "other": 0}
+
+    def worker(n):
+        rng = random.Random(n)
+        counter = 0
+        while time.perf_counter() < deadline:
+            kind = "write" if rng.random() * 100 < args.writes else "read"
+            started = time.perf_counter()
+            try:
+                with Session() as session:
+                    if kind == "write":
+                        counter += 1
+                        add_participation(
+                            session, rng.randint(1, event_count), rng.randint(1, 3), f"t{n}u{counter}", n
+                        )
+                    else:
+                        get_events_for_dates(session, DEFAULT_TENANT_ID, dates)
+            except OperationalError as e:
+                with lock:
+                    errors["locked" if "locked" in str(e) else "other"] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[kind].append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    done = len(latencies["read"]) + len(latencies["write"])
+    print(f"  {profile:<11}{done / elapsed:>8.0f} ops/s"
+          f"{percentile(latencies['read'], 99) * 1000:>10.1f}"
+          f"{percentile(latencies['write'], 99) * 1000:>11.1f}"
+          f"{errors['locked']:>9}{errors['other']:>7}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--writes", type=float, default=20.0, help="percent of operations that write")
+    parser.add_argument("--profile", choices=PROFILES, action="append")
+    args = parser.parse_args()
+    # Like the bot, give every worker thread its own pooled connection.
+    os.environ["DB_POOL_SIZE"] = str(args.threads)
+    print(f"{args.threads} threads, {args.writes:.0f}% writes, {args.seconds:.0f} s per profile")
+    print(f"  {'profile':<11}{'throughput':>14}{'read p99':>10}{'write p99':>11}{'locked':>9}{'other':>7}")
+    for profile in args.profile or PROFILES:
+        run_profile(profile, args)
+
+if __name__ == "__main__":
+    main()
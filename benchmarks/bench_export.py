@@ -0,0 +1,93 @@
+"""Measure the memory an export takes as its date range grows.
+
+Seeds several years of events and signups, then exports ranges of one
+month up to the whole history as CSV and iCalendar. For comparison the
+same range is also loaded as an ORM object graph and rendered into an
+in-memory string, as a straightforward export would do. Python heap
+peaks are taken with tracemalloc.
+
+    python -m benchmarks.bench_export --years 5 --users 300 --per-event 8
+"""
+import os
+import io
+import time
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_export.db")
+
+from benchmarks.offline import seed_years
+
+def orm_export(tenant_id, start, end):
+    from sqlalchemy.orm import selectinload
+    from db.context import db_session
+    from db_setup import Event, Participation
+    out = io.StringIO()
+    with db_session() as session:
+        events = (
+            session.query(Event)
+            .options(selectinload(Event.participations).selectinload(Participation.role))
+            .filter(Event.tenant_id == tenant_id, Event.date >= start, Event.date <= end)
+            .order_by(Event.date, Event.time)
+            .all()
+        )
+        for event in events:
+            for part in event.participations:
+                out.write(f"{event.date},{event.time},{event.slot},{event.name},{part.role.name},{part.username}\n")
+    return out.getvalue().encode()
+
+def size_of(result) -> int:
+    if isinstance(result, bytes):
+        return len(result)
+    result.seek(0, io.SEEK_END)
+    size = result.tell()
+    result.close()
+    return size
+
+def measure(fn):
+    # Timed on its own, since tracemalloc slows allocation-heavy code down several times.
+    started = time.perf_counter()
+    size = size_of(fn())
+    elapsed = (time.perf_counter() - started) * 1000
+    tracemalloc.start()
+    size_of(fn())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, size, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--per-event", type=int, default=8)
+    args = parser.parse_args()
+
+    from db_setup import DEFAULT_TENANT_ID, init_db
+    from service.export import EXPORT_CHUNK_ROWS, EXPORT_SPOOL_BYTES, export_schedule
+    init_db()
+    first, events, parts = seed_years(args.years, args.users, args.per_event)
+    print(f"{events} events, {parts} participations over {args.years} years; "
+          f"chunks of {EXPORT_CHUNK_ROWS} rows, spool {EXPORT_SPOOL_BYTES // 1024} KiB")
+    end = date.today()
+    ranges = [("1 month", end - timedelta(days=30))]
+    ranges += [(f"{y} year{'s' if y > 1 else ''}", end - timedelta(days=365 * y)) for y in (1, 2) if y < args.years]
+    ranges += [(f"{args.years} years", first)]
+    # Warm SQLAlchemy's statement caches so the first row does not carry them.
+    for fmt in ("csv", "ics"):
+        export_schedule(DEFAULT_TENANT_ID, end, end, fmt).close()
+    orm_export(DEFAULT_TENANT_ID, end, end)
+    print(f"  {'range':<10}{'export':<8}{'output KiB':>12}{'peak KiB':>10}{'ms':>9}")
+    for label, start in ranges:
+        runs = [
+            ("csv", lambda: export_schedule(DEFAULT_TENANT_ID, start, end, "csv")),
+            ("ics", lambda: export_schedule(DEFAULT_TENANT_ID, start, end, "ics")),
+            ("orm", lambda: orm_export(DEFAULT_TENANT_ID, start, end)),
+        ]
+        for name, fn in runs:
+            peak, size, elapsed = measure(fn)
+            print(f"  {label:<10}{name:<8}{size / 1024:>12.0f}{peak / 1024:>10.0f}{elapsed:>9.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare hot-path query times on a large database with and without indexes.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_indexes --years 5 --users 300
+"""
+import os
+import time
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_indexes.db")
+
+from sqlalchemy import text
+from db_setup import DEFAULT_TENANT_ID, Base, Participation, default_engine, init_db
+from db.context import db_session
+from db.queries import get_events_for_dates, get_upcoming_participations
+from benchmarks.offline import seed_years
+
+engine = default_engine()
+
+def drop_indexes():
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+def timed(label, fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+    print(f"  {label:<28} {elapsed:8.3f} ms")
+
+def run_queries(users: int, repeat: int):
+    today = date.today()
+    week = [today + timedelta(days=i) for i in range(7)]
+    with db_session() as session:
+        timed("week schedule", lambda: get_events_for_dates(session, DEFAULT_TENANT_ID, week), repeat)
+        timed("user upcoming signups", lambda: get_upcoming_participations(session, DEFAULT_TENANT_ID, "user1", today), repeat)
+        timed("duplicate signup check", lambda: session.query(Participation).filter_by(
+            event_id=1, role_id=1, username=f"user{users - 1}").first(), repeat)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--per-event", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    drop_indexes()
+    _, events, parts = seed_years(args.years, args.users, args.per_event)
+    print(f"{events} events, {parts} participations")
+    print("without indexes:")
+    run_queries(args.users, args.repeat)
+    init_db()
+    print("with indexes:")
+    run_queries(args.users, args.repeat)
+
+if __name__ == "__main__":
+    main()
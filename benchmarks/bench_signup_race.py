@@ -0,0 +1,104 @@
+"""Fire many simultaneous signups of one user for the same event role.
+
+Threads released by a barrier all call add_participation for the same
+event, role and username, as repeated taps arriving at once would. Exactly
+one must report SIGNED_UP, the rest ALREADY_SIGNED_UP, none may raise, and
+the database must hold one participation with a taken counter of one.
+Exits with status 1 otherwise.
+
+    python -m benchmarks.bench_signup_race --threads 32 --rounds 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_signup_race.db")
+
+def prepare(rounds: int):
+    from db_setup import DEFAULT_TENANT_ID, init_db
+    from service.schedule_service import ensure_week_events, get_week_schedule
+
+    init_db()
+    ensure_week_events(DEFAULT_TENANT_ID)
+    slots = [(event.id, role.id) for event in get_week_schedule(DEFAULT_TENANT_ID) for role in event.roles]
+    return [slots[n % len(slots)] + (f"racer{n}",) for n in range(rounds)]
+
+def race(target, threads: int):
+    from db.context import db_session
+    from db.queries import ALREADY_SIGNED_UP, SIGNED_UP, add_participation
+
+    names = {SIGNED_UP: "signed up", ALREADY_SIGNED_UP: "duplicate"}
+    barrier = threading.Barrier(threads)
+    outcomes, errors, lock = Counter(), [], threading.Lock()
+
+    def worker():
+        barrier.wait()
+        try:
+            with db_session() as session:
+                outcome = names.get(add_participation(session, *target), "other")
+        except Exception as exc:
+            with lock:
+                errors.append(repr(exc))
+            return
+        with lock:
+            outcomes[outcome] += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return outcomes, errors
+
+def check(target):
+    from sqlalchemy import func, select
+    from db_setup import Participation, event_roles
+    from db.context import db_session
+
+    event_id, role_id, username = target
+    with db_session() as session:
+        rows = session.execute(
+            select(func.count()).where(
+                Participation.event_id == event_id, Participation.role_id == role_id,
+                Participation.username == username,
+            )
+        ).scalar()
+        taken = session.execute(
+            select(event_roles.c.taken).where(event_roles.c.event_id == event_id, event_roles.c.role_id == role_id)
+        ).scalar()
+    return rows, taken
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32, help="simultaneous signups per round")
+    parser.add_argument("--rounds", type=int, default=20, help="event roles raced for, one user each")
+    parser.add_argument("--profile", default="production")
+    args = parser.parse_args()
+    os.environ["DB_PROFILE"] = args.profile
+    os.environ["DB_POOL_SIZE"] = str(args.threads)
+
+    targets = prepare(args.rounds)
+    failures, totals = [], Counter()
+    started = time.perf_counter()
+    for target in targets:
+        outcomes, errors = race(target, args.threads)
+        rows, taken = check(target)
+        totals.update(outcomes)
+        totals["errors"] += len(errors)
+        if outcomes["signed up"] != 1 or errors or rows != 1 or taken != 1:
+            failures.append((target, dict(outcomes), errors[:1], rows, taken))
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.rounds} rounds of {args.threads} simultaneous signups, profile {args.profile}, {elapsed:.2f} s")
+    for key in ("signed up", "duplicate", "other", "errors"):
+        print(f"  {key + ':':<11} {totals[key]}")
+    print(f"  rounds without exactly one row: {len(failures)} {failures[:3] if failures else ''}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
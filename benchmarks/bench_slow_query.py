@@ -0,0 +1,90 @@
+"""Check that a slow database call does not delay an unrelated user's update.
+
+Runs a deliberately slow SQL query through db.context.run_query while
+another user's "Отменить участие" update, which queries their signups, is
+handled, and times that update. For
+comparison the same query is also run directly on the event loop, as the
+handlers did before the db executor. Exits with status 1 if the unrelated
+update takes longer than --limit while the slow query runs in the executor.
+
+    python -m benchmarks.bench_slow_query --rows 3000000 --limit 0.2
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_slow_query.db")
+
+SLOW_SQL = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) SELECT count(*) FROM c"
+
+def slow_query(session, rows):
+    from sqlalchemy import text
+    return session.execute(text(SLOW_SQL), {"n": rows}).scalar()
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, CallbackContext
+    from bot import build_application
+    from benchmarks.offline import OfflineRequest, message_update
+    from db.context import db_session, run_query
+    from db_setup import DEFAULT_TENANT_ID
+    from flows.cancellation import show_cancel_participation_menu
+    from service.schedule_service import ensure_week_events
+
+    ensure_week_events(DEFAULT_TENANT_ID)
+    builder = ApplicationBuilder().token("123456:offline").request(OfflineRequest()).get_updates_request(OfflineRequest())
+    app = build_application(builder)
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def unrelated_update(started=None):
+        update = Update.de_json(message_update(next(update_ids), 2000, "Отменить участие"), app.bot)
+        started = started or time.perf_counter()
+        await show_cancel_participation_menu(update, CallbackContext.from_update(update, app))
+        return time.perf_counter() - started
+
+    async def on_loop():
+        with db_session() as session:
+            slow_query(session, args.rows)
+
+    async def in_executor():
+        await run_query(slow_query, args.rows)
+
+    async def alongside(slow):
+        # Both arrive together; the slow query is started first.
+        started = time.perf_counter()
+        task = asyncio.create_task(slow())
+        latency = await asyncio.create_task(unrelated_update(started))
+        await task
+        return latency
+
+    async with app:
+        await unrelated_update()  # warm the statement caches
+        alone = await unrelated_update()
+        started = time.perf_counter()
+        await in_executor()
+        slow = time.perf_counter() - started
+        blocked = await alongside(on_loop)
+        offloaded = await alongside(in_executor)
+
+    print(f"slow query: {slow:.2f} s ({args.rows} rows)")
+    print(f"  unrelated update alone:                 {alone * 1000:>8.1f} ms")
+    print(f"  alongside the query on the event loop:  {blocked * 1000:>8.1f} ms")
+    print(f"  alongside the query in the db executor: {offloaded * 1000:>8.1f} ms")
+    if offloaded > args.limit:
+        print(f"FAIL: the unrelated update took longer than {args.limit * 1000:.0f} ms")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=3000000, help="rows the slow query counts")
+    parser.add_argument("--limit", type=float, default=0.2, help="seconds the unrelated update may take")
+    args = parser.parse_args()
+    from db_setup import init_db
+    init_db()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measure cold import/startup time of the bot's modules in fresh interpreters.
+
+Each case runs in its own Python process so nothing is cached between
+runs; the median of --runs is reported, along with whether an engine
+was created and whether a database file appeared. Run from the
+repository root:
+
+    python -m benchmarks.bench_startup --runs 7
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+PROBE = """
+import gc, json, os, sys, time
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+modules = len(sys.modules)
+base = sys.modules.get("sqlalchemy.engine.base")
+print(json.dumps({{
+    "seconds": elapsed,
+    "engine": bool(base) and any(isinstance(o, base.Engine) for o in gc.get_objects()),
+    "db_file": os.path.exists(os.environ["DB_NAME"]),
+    "modules": modules,
+}}))
+"""
+
+BUILD_APP = """
+from telegram.ext import ApplicationBuilder
+from benchmarks.offline import OfflineRequest
+import bot
+bot.build_application(ApplicationBuilder().token("123456:offline").request(OfflineRequest()))
+"""
+
+CASES = {
+    "import utils.formatting": "import utils.formatting",
+    "import db.queries": "import db.queries",
+    "import bot": "import bot",
+    "bot.build_application()": BUILD_APP,
+}
+
+def probe(code: str) -> dict:
+    env = dict(os.environ, DB_NAME=os.path.join(tempfile.mkdtemp(), "startup.db"))
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(code=code)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    args = parser.parse_args()
+    print(f"median of {args.runs} fresh interpreters")
+    print(f"  {'case':<26}{'ms':>8}{'modules':>9}{'engine':>8}{'db file':>9}")
+    for name, code in CASES.items():
+        results = [probe(code) for _ in range(args.runs)]
+        last = results[-1]
+        print(f"  {name:<26}{statistics.median(r['seconds'] for r in results) * 1000:>8.1f}"
+              f"{last['modules']:>9}{'yes' if last['engine'] else 'no':>8}"
+              f"{'yes' if last['db_file'] else 'no':>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Show that schedule latency stays flat as the number of tenants grows.
+
+Tenants are added in steps to one database. At each step, random tenants
+request their schedule text, with a share of requests preceded by a write
+that invalidates the tenant's page. Cache hits and misses (loads from the
+database) are timed separately.
+
+    python -m benchmarks.bench_tenants --tenants 1 10 100 1000 --requests 5000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_tenants.db")
+
+from benchmarks.offline import percentile
+
+def add_tenants(first: int, last: int, signups: int):
+    from sqlalchemy import insert, select
+    from db_setup import Event, Participation, default_engine, event_roles
+    from service.schedule_service import ensure_week_events
+    from service.tenants import get_or_create_tenant
+
+    tenant_ids = [get_or_create_tenant(-1000 - n, f"group {n}") for n in range(first, last)]
+    for tenant_id in tenant_ids:
+        ensure_week_events(tenant_id)
+    with default_engine().begin() as conn:
+        rows = conn.execute(
+            select(event_roles.c.event_id, event_roles.c.role_id)
+            .join(Event, Event.id == event_roles.c.event_id)
+            .where(Event.tenant_id.in_(tenant_ids))
+        ).all()
+        if rows and signups:
+            conn.execute(insert(Participation), [
+                {"event_id": event_id, "role_id": role_id, "username": f"user{n}"}
+                for event_id, role_id in rows
+                for n in range(signups)
+            ])
+    return tenant_ids
+
+def run(tenant_ids, requests: int, write_share: float):
+    from datetime import date
+    from service.schedule_service import (
+        get_week_schedule_text, invalidate_week_schedule, schedule_cache_stats
+    )
+
+    before = schedule_cache_stats()
+    hits, misses = [], []
+    for _ in range(requests):
+        tenant_id = random.choice(tenant_ids)
+        if random.random() < write_share:
+            invalidate_week_schedule(tenant_id, date.today())
+        misses_before = schedule_cache_stats()["misses"]
+        started = time.perf_counter()
+        get_week_schedule_text(tenant_id)
+        elapsed = (time.perf_counter() - started) * 1000
+        (misses if schedule_cache_stats()["misses"] > misses_before else hits).append(elapsed)
+    after = schedule_cache_stats()
+    return hits, misses, after["evictions"] - before["evictions"], after["size"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--signups", type=int, default=2, help="participants per event role")
+    parser.add_argument("--write-share", type=float, default=0.1)
+    args = parser.parse_args()
+
+    from db_setup import init_db
+    from service.schedule_service import SCHEDULE_CACHE_PAGES
+    init_db()
+
+    print(f"{args.requests} requests per step, {args.write_share:.0%} after a write, "
+          f"cache of {SCHEDULE_CACHE_PAGES} pages")
+    print(f"{'tenants':>8} {'hit rate':>9} {'hit p50':>8} {'hit p99':>8} "
+          f"{'miss p50':>9} {'miss p99':>9} {'all p50':>8} {'all p99':>8} {'evicted':>8}")
+    tenant_ids = []
+    for count in sorted(args.tenants):
+        tenant_ids += add_tenants(len(tenant_ids), count, args.signups)
+        run(tenant_ids, min(args.requests, 5 * count), 0.0)  # warm the cache
+        hits, misses, evicted, _ = run(tenant_ids, args.requests, args.write_share)
+        both = hits + misses
+        print(f"{count:>8} {len(hits) / len(both):>9.1%} "
+              f"{percentile(hits, 50):>8.3f} {percentile(hits, 99):>8.3f} "
+              f"{percentile(misses, 50):>9.3f} {percentile(misses, 99):>9.3f} "
+              f"{percentile(both, 50):>8.3f} {percentile(both, 99):>8.3f} {evicted:>8}")
+    print("latencies in ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Compare the flat-column week read path with the joinedload ORM path it replaced.
+
+Reports SQL rows fetched, memory allocated for the resulting DTOs and
+time per call for a week with many participants per event:
+
+    python -m benchmarks.bench_week_query --participants 60
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "bench_week_query.db")
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import joinedload
+from db_setup import DEFAULT_TENANT_ID, Event, Participation, Role, default_engine, init_db
+from db.context import db_session
+from db.dto import EventDTO, ParticipationDTO, RoleDTO
+from db.queries import get_events_for_dates
+from service.schedule_service import ensure_week_events, week_dates
+
+engine = default_engine()
+
+def legacy_event_dto(event: Event) -> EventDTO:
+    return EventDTO(
+        id=event.id,
+        date=event.date.isoformat(),
+        slot=event.slot,
+        name=event.name,
+        time=event.time,
+        roles=[RoleDTO(id=role.id, name=role.name) for role in event.roles],
+        seats={},
+        participations=[
+            ParticipationDTO(
+                id=part.id,
+                username=part.username,
+                role=RoleDTO(id=part.role.id, name=part.role.name) if part.role else None,
+            )
+            for part in event.participations
+        ],
+    )
+
+def joinedload_events(session, dates):
+    events = (
+        session.query(Event)
+        .options(
+            joinedload(Event.roles),
+            joinedload(Event.participations).joinedload(Participation.role),
+        )
+        .filter(Event.date.in_(dates))
+        .order_by(Event.date, Event.slot)
+        .all()
+    )
+    return [legacy_event_dto(e) for e in events]
+
+def flat_events(session, dates):
+    return get_events_for_dates(session, DEFAULT_TENANT_ID, dates)
+
+def seed(participants: int):
+    ensure_week_events(DEFAULT_TENANT_ID)
+    with engine.begin() as conn:
+        role_ids = [row.id for row in conn.execute(Role.__table__.select())]
+        event_ids = [row.id for row in conn.execute(Event.__table__.select())]
+        conn.execute(insert(Participation), [
+            {"event_id": e, "role_id": random.choice(role_ids), "username": f"user{u}"}
+            for e in event_ids
+            for u in range(participants)
+        ])
+    return len(event_ids)
+
+def rows_fetched(loader, dates):
+    statements = []
+    listener = lambda conn, cursor, statement, params, context, many: statements.append((statement, params))
+    event.listen(engine, "before_cursor_execute", listener)
+    with db_session() as session:
+        loader(session, dates)
+    event.remove(engine, "before_cursor_execute", listener)
+    with engine.connect() as conn:
+        return len(statements), sum(len(conn.exec_driver_sql(s, p).fetchall()) for s, p in statements)
+
+def measure(label, loader, dates, repeat):
+    queries, rows = rows_fetched(loader, dates)
+    with db_session() as session:
+        tracemalloc.start()
+        result = loader(session, dates)
+        _, peak = tracemalloc.get_traced_memory()
+        retained = tracemalloc.take_snapshot().statistics("filename")
+        tracemalloc.stop()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            loader(session, dates)
+        elapsed = (time.perf_counter() - started) / repeat * 1000
+    kept = sum(stat.size for stat in retained)
+    parts = sum(len(e.participations) for e in result)
+    print(f"{label:<12}{queries:>8}{rows:>10}{peak / 1024:>12.0f}{kept / 1024:>12.0f}{elapsed:>10.2f}   ({parts} participations)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--participants", type=int, default=60, help="participants per event")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    init_db()
+    events = seed(args.participants)
+    dates = week_dates()
+    print(f"{events} events x {args.participants} participants")
+    print(f"{'path':<12}{'queries':>8}{'rows':>10}{'peak KiB':>12}{'kept KiB':>12}{'ms/call':>10}")
+    measure("joinedload", joinedload_events, dates, args.repeat)
+    measure("flat", flat_events, dates, args.repeat)
+
+if __name__ == "__main__":
+    main()
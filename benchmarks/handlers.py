@@ -0,0 +1,148 @@
+"""Benchmark the bot's handlers against a seeded temporary database.
+
+Handlers are called directly with real Update/CallbackContext objects
+whose bot is backed by OfflineRequest, so every Bot API call is counted
+without contacting Telegram. For each handler the report lists latency
+percentiles, SQL statements per call and Bot API calls per call.
+
+    python -m benchmarks.handlers --weeks 104 --users 300 --signups 8 --iterations 200
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "handlers.db")
+os.environ.setdefault("ADMIN_IDS", "1000")
+
+from benchmarks.offline import (
+    OfflineRequest, callback_update, inline_query_update, message_update, percentile
+)
+
+def seed(weeks: int, users: int, signups: int):
+    from sqlalchemy import insert
+    from db_setup import DEFAULT_TENANT_ID, Event, Participation, Role, default_engine, event_roles, recount_seats
+    from service.schedule_service import DEFAULT_ROLES, ensure_week_events
+
+    ensure_week_events(DEFAULT_TENANT_ID)
+    start = date.today() - timedelta(weeks=weeks)
+    with default_engine().begin() as conn:
+        role_ids = [
+            conn.execute(Role.__table__.select().where(Role.name == name)).first().id
+            for name in DEFAULT_ROLES
+        ]
+        history = [
+            {"date": start + timedelta(days=d), "slot": slot, "name": slot, "time": "08:00"}
+            for d in range(weeks * 7)
+            for slot in ("morning", "evening")
+        ]
+        if history:
+            conn.execute(insert(Event), history)
+        event_ids = [row.id for row in conn.execute(Event.__table__.select())]
+        conn.execute(insert(event_roles).prefix_with("OR IGNORE"), [
+            {"event_id": e, "role_id": r} for e in event_ids for r in role_ids
+        ])
+        conn.execute(insert(Participation), [
+            {"event_id": e, "role_id": random.choice(role_ids), "username": f"user{1000 + u}"}
+            for e in event_ids
+            for u in random.sample(range(users), min(signups, users))
+        ])
+    recount_seats()
+    return len(event_ids)
+
+class Recorder:
+    """Counts SQL statements issued through the application's engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.statements = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.statements += 1
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, CallbackContext
+    from bot import build_application
+    from db_setup import default_engine
+    from flows.admin import admin
+    from flows.inline import inline_schedule
+    from flows.cancellation import show_cancel_participation_menu
+    from flows.participation import (
+        schedule_handler, participate_handler, choose_day, choose_event, choose_role
+    )
+    from db_setup import DEFAULT_TENANT_ID
+    from service.schedule_service import get_week_schedule
+
+    request = OfflineRequest()
+    builder = ApplicationBuilder().token("123456:offline").request(request).get_updates_request(OfflineRequest())
+    app = build_application(builder)
+    recorder = Recorder(default_engine())
+    events = get_week_schedule(DEFAULT_TENANT_ID)
+    admin_id = int(os.environ["ADMIN_IDS"].split(",")[0])
+    stats = {}
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def call(name, handler, payload):
+        update = Update.de_json(payload, app.bot)
+        context = CallbackContext.from_update(update, app)
+        statements, api_calls = recorder.statements, sum(request.calls.values())
+        started = time.perf_counter()
+        await handler(update, context)
+        elapsed = time.perf_counter() - started
+        entry = stats.setdefault(name, {"latency": [], "sql": 0, "api": 0, "calls": 0})
+        entry["latency"].append(elapsed)
+        entry["sql"] += recorder.statements - statements
+        entry["api"] += sum(request.calls.values()) - api_calls
+        entry["calls"] += 1
+
+    async with app:
+        for i in range(args.iterations):
+            user_id = 1000 + i % args.users
+            event = random.choice(events)
+            role = random.choice(event.roles)
+            await call("schedule_handler", schedule_handler, message_update(next(update_ids), user_id, "Расписание"))
+            await call("participate_handler", participate_handler, message_update(next(update_ids), user_id, "Участвовать"))
+            await call("choose_day", choose_day, callback_update(next(update_ids), user_id, f"chooseday|{event.date}"))
+            await call("choose_event", choose_event, callback_update(next(update_ids), user_id, f"chooseevent|{event.id}"))
+            await call("choose_role", choose_role, callback_update(next(update_ids), user_id, f"chooserole|{role.id}"))
+            await call("show_cancel_participation_menu", show_cancel_participation_menu,
+                       message_update(next(update_ids), user_id, "Отменить участие"))
+            await call("admin", admin, message_update(next(update_ids), admin_id, "Редактировать события"))
+            await call("inline_schedule", inline_schedule, inline_query_update(next(update_ids), user_id, "week"))
+            await call("inline_schedule (day)", inline_schedule,
+                       inline_query_update(next(update_ids), user_id, event.date))
+
+    print(f"{'handler':<32}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'sql/call':>10}{'api/call':>10}")
+    for name, entry in stats.items():
+        latency = entry["latency"]
+        print(
+            f"{name:<32}"
+            f"{percentile(latency, 50) * 1000:>9.2f}"
+            f"{percentile(latency, 95) * 1000:>9.2f}"
+            f"{percentile(latency, 99) * 1000:>9.2f}"
+            f"{entry['sql'] / entry['calls']:>10.2f}"
+            f"{entry['api'] / entry['calls']:>10.2f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=104, help="weeks of history to seed")
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--signups", type=int, default=8, help="signups per event")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    from db_setup import init_db
+    init_db()
+    total = seed(args.weeks, args.users, args.signups)
+    print(f"seeded {total} events, {args.users} users, {args.signups} signups per event")
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
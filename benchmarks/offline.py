@@ -0,0 +1,130 @@
+"""Offline stand-ins for the Telegram Bot API, and helpers shared by the benchmarks."""
+import json
+import random
+import asyncio
+from collections import Counter
+from datetime import date, timedelta
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+class OfflineRequest(BaseRequest):
+    """Answers Bot API calls locally and counts them per method."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id") or 0)
+            return {
+                "message_id": self._message_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.json_parameters if request_data else {}
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = {"ok": True, "result": self._result(endpoint, params)}
+        return 200, json.dumps(body).encode()
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "",
+            },
+        },
+    }
+
+def inline_query_update(update_id: int, user_id: int, query: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"user{user_id}"}
+    return {
+        "update_id": update_id,
+        "inline_query": {
+            "id": str(update_id),
+            "from": user,
+            "query": query,
+            "offset": "",
+            "chat_type": "supergroup",
+        },
+    }
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def seed_history(start: date, days: int, users: int, per_event: int):
+    """Add a morning and an evening event for ``days`` days from ``start``, each with
+    ``per_event`` signups of random ``users`` across roles 1-3, which init_db() seeds.
+
+    Returns the number of events and of participations added.
+    """
+    # Imported here: the benchmarks point DB_NAME at a temporary file first.
+    from sqlalchemy import insert, select
+    from db_setup import Event, Participation, default_engine, event_roles
+    with default_engine().begin() as conn:
+        first_id = (conn.execute(select(Event.id).order_by(Event.id.desc())).scalar() or 0) + 1
+        conn.execute(insert(Event), [
+            {"date": start + timedelta(days=d), "slot": slot, "name": slot, "time": time}
+            for d in range(days)
+            for slot, time in (("morning", "08:00"), ("evening", "19:30"))
+        ])
+        event_ids = conn.execute(select(Event.id).where(Event.id >= first_id)).scalars().all()
+        conn.execute(insert(event_roles), [{"event_id": e, "role_id": r} for e in event_ids for r in (1, 2, 3)])
+        rows = [
+            {"event_id": e, "role_id": random.randint(1, 3), "username": f"user{u}"}
+            for e in event_ids
+            for u in random.sample(range(users), per_event)
+        ]
+        conn.execute(insert(Participation), rows)
+    return len(event_ids), len(rows)
+
+def seed_years(years: int, users: int, per_event: int):
+    """seed_history() from ``years`` years ago to a week ahead; returns its start date as well."""
+    start = date.today() - timedelta(days=365 * years)
+    return (start, *seed_history(start, 365 * years + 7, users, per_event))
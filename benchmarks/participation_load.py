@@ -0,0 +1,99 @@
+"""Push many users through the participation flow at once and report latency.
+
+Every user sends "Участвовать" and then taps day, event and role without
+waiting for replies, so the run also checks that updates from one user
+are handled in order. Run from the repository root:
+
+    python -m benchmarks.participation_load --users 300 --concurrency 64
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "participation_load.db")
+
+from benchmarks.offline import OfflineRequest, callback_update, message_update, percentile
+
+async def run(args):
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder
+    from bot import OrderedApplication, build_application
+    from db.context import db_session
+    from db_setup import DEFAULT_TENANT_ID, Participation, default_engine, event_roles
+    from service.schedule_service import ensure_week_events, get_week_schedule
+
+    ensure_week_events(DEFAULT_TENANT_ID)
+    with default_engine().begin() as conn:
+        # Lift role limits so every user's signup lands; bench_capacity covers full roles.
+        conn.execute(event_roles.update().values(capacity=None))
+    events = get_week_schedule(DEFAULT_TENANT_ID)
+    enqueued, latencies = {}, []
+    done = {}
+
+    class TimedApplication(OrderedApplication):
+        async def process_update(self, update):
+            try:
+                await super().process_update(update)
+            finally:
+                latencies.append(time.perf_counter() - enqueued[update.update_id])
+                done[update.update_id].set()
+
+    builder = (
+        ApplicationBuilder()
+        .token("123456:offline")
+        .request(OfflineRequest(latency=args.api_latency))
+        .get_updates_request(OfflineRequest())
+    )
+    app = build_application(builder, application_class=TimedApplication)
+    next_id = iter(range(1, 10 ** 9))
+
+    async def put(payload):
+        update = Update.de_json(payload, app.bot)
+        enqueued[update.update_id] = time.perf_counter()
+        done[update.update_id] = asyncio.Event()
+        await app.update_queue.put(update)
+        return done[update.update_id]
+
+    async def user_flow(user_id):
+        event = random.choice(events)
+        role = random.choice(event.roles)
+        pending = [
+            await put(message_update(next(next_id), user_id, "Участвовать")),
+            await put(callback_update(next(next_id), user_id, f"chooseday|{event.date}")),
+            await put(callback_update(next(next_id), user_id, f"chooseevent|{event.id}")),
+            await put(callback_update(next(next_id), user_id, f"chooserole|{role.id}")),
+        ]
+        for finished in pending:
+            await finished.wait()
+
+    async with app:
+        await app.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(user_flow(1000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        await app.stop()
+
+    with db_session() as session:
+        signups = session.query(Participation).count()
+    print(f"{args.users} users, concurrent_updates={app.concurrent_updates}")
+    print(f"  throughput:  {len(latencies) / elapsed:.0f} updates/s ({elapsed:.2f} s)")
+    print(f"  latency p50: {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"  latency p99: {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"  signups:     {signups}/{args.users}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=64, help="0 handles updates one by one")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="simulated Bot API latency, seconds")
+    args = parser.parse_args()
+    os.environ["CONCURRENT_UPDATES"] = str(args.concurrency)
+    from db_setup import init_db
+    init_db()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Drive the bot's webhook with synthetic updates and report end-to-end throughput.
+
+Telegram is never contacted: outgoing Bot API calls are answered by
+OfflineRequest. Run from the repository root:
+
+    python -m benchmarks.webhook_load --updates 2000 --users 200
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+os.environ["DB_NAME"] = os.path.join(tempfile.mkdtemp(), "webhook_load.db")
+
+import httpx
+from telegram.ext import ApplicationBuilder
+from bot import build_application
+from db_setup import init_db
+from benchmarks.offline import OfflineRequest, message_update
+
+SECRET = "bench-secret"
+
+async def run(args):
+    request = OfflineRequest(latency=args.api_latency)
+    builder = (
+        ApplicationBuilder()
+        .token("123456:offline")
+        .request(request)
+        .get_updates_request(OfflineRequest())
+    )
+    app = build_application(builder)
+    url = f"http://127.0.0.1:{args.port}/{args.path}"
+    async with app:
+        await app.updater.start_webhook(
+            listen="127.0.0.1",
+            port=args.port,
+            url_path=args.path,
+            webhook_url=url,
+            secret_token=SECRET,
+            max_connections=args.connections,
+        )
+        await app.start()
+        limits = httpx.Limits(max_connections=args.connections)
+        async with httpx.AsyncClient(limits=limits) as client:
+            headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            semaphore = asyncio.Semaphore(args.connections)
+
+            async def post(i):
+                async with semaphore:
+                    update = message_update(i + 1, 1000 + i % args.users, "Расписание")
+                    response = await client.post(url, json=update, headers=headers)
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(i) for i in range(args.updates)))
+            accepted = time.perf_counter() - started
+            while request.calls["sendMessage"] < args.updates:
+                await asyncio.sleep(0.005)
+            handled = time.perf_counter() - started
+        await app.updater.stop()
+        await app.stop()
+    print(f"{args.updates} updates from {args.users} users")
+    print(f"  accepted by webhook: {accepted:.2f} s ({args.updates / accepted:.0f} updates/s)")
+    print(f"  fully handled:       {handled:.2f} s ({args.updates / handled:.0f} updates/s)")
+    print(f"  bot API calls:       {dict(request.calls)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=40)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Bot API latency, seconds")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--path", default="telegram")
+    args = parser.parse_args()
+    init_db()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,225 @@
 import os
+import re
+import asyncio
 import logging
+from collections import deque
+from itertools import chain
+from telegram import Update
 from telegram.ext import (
-    ApplicationBuilder, CommandHandler, MessageHandler, filters
+    Application, ApplicationBuilder, CallbackQueryHandler, CommandHandler, ConversationHandler,
+    MessageHandler, filters
 )
+from telegram.ext._application import _STOP_SIGNAL  # python-telegram-bot is pinned to 20.3
+from telegram.request import HTTPXRequest
 from dotenv import load_dotenv
 
-from shared.main_menu import start
-from flows.participation import participate_conv, schedule_handler
-from flows.cancellation import cancel_conv
-from flows.admin import admin_conv
-
+# The bot's own modules read their settings from the environment when first
+# imported, so .env is loaded before any of them and the rest are imported
+# where first needed.
 load_dotenv()
+
+from utils.metrics import (
+    instrument_application, instrument_engine, record_api_call, start_reporting, stop_reporting
+)
+
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# "polling" (default) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public base URL Telegram posts to
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Updates handled at once across different chats; 0 processes them one by one.
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
+logger = logging.getLogger(__name__)
 
-def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that counts Bot API calls for the handler making them."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        record_api_call(url)
+        return await super().do_request(url, method, *args, **kwargs)
+
+class OrderedApplication(Application):
+    """Handles updates concurrently while keeping each chat/user pair in order.
+
+    The conversation handlers key their state by (chat, user), so updates
+    sharing that key are run one after another in arrival order. They wait
+    in a queue per key and take one of the CONCURRENT_UPDATES slots only
+    when their turn comes, so one busy user cannot hold slots others need.
+    Updates no conversation can handle, such as inline queries and schedule
+    page buttons, are not ordered at all. After an update a conversation may
+    have handled, the persistence is written at once, so a crash loses no
+    conversation step.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._pending_by_key = {}
+        self._conversation_patterns = None
+        self._persist_run = None
+        self._persist_lock = asyncio.Lock()
+
+    def _conversation_callback(self, data) -> bool:
+        # Whether a callback query with ``data`` may belong to a conversation, in any state.
+        if self._conversation_patterns is None:
+            self._conversation_patterns = [
+                handler.pattern
+                for group in self.handlers.values()
+                for conversation in group
+                if isinstance(conversation, ConversationHandler)
+                for handler in chain(
+                    conversation.entry_points, conversation.fallbacks, *conversation.states.values()
+                )
+                if isinstance(handler, CallbackQueryHandler)
+            ]
+        return any(
+            not isinstance(pattern, re.Pattern) or (isinstance(data, str) and pattern.match(data))
+            for pattern in self._conversation_patterns
+        )
+
+    def _order_key(self, update):
+        """The (chat, user) key ``update`` is ordered by, or None if no conversation can handle it."""
+        if not isinstance(update, Update) or update.effective_chat is None:
+            return None
+        if update.callback_query and not self._conversation_callback(update.callback_query.data):
+            return None
+        return (update.effective_chat.id, update.effective_user.id if update.effective_user else None)
+
+    async def process_update(self, update):
+        await super().process_update(update)
+        # PTB writes conversation states only every persistence update_interval; write
+        # them now, with the user and chat data the next step reads.
+        if self.persistence and self._order_key(update) is not None:
+            if self._persist_run is None:
+                self._persist_run = asyncio.ensure_future(self._persist())
+            await asyncio.shield(self._persist_run)
+
+    async def _persist(self):
+        # One run at a time; updates finishing meanwhile all wait for the single next run.
+        async with self._persist_lock:
+            self._persist_run = None
+            await self.update_persistence()
+
+    async def _update_fetcher(self):
+        # Replaces Application._update_fetcher, which takes a slot per update right away.
+        if not self.concurrent_updates:
+            return await super()._update_fetcher()
+        while True:
+            update = await self.update_queue.get()
+            if update is _STOP_SIGNAL:
+                while not self.update_queue.empty():
+                    self.update_queue.get_nowait()
+                    self.update_queue.task_done()
+                self.update_queue.task_done()
+                return
+            key = self._order_key(update)
+            if key is None:
+                self.create_task(self._process_in_slot(update), update=update)
+            elif key in self._pending_by_key:
+                self._pending_by_key[key].append(update)
+            else:
+                self._pending_by_key[key] = deque([update])
+                self.create_task(self._process_in_order(key), update=update)
+
+    async def _process_in_slot(self, update):
+        try:
+            async with self._concurrent_updates_sem:
+                await self.process_update(update)
+        finally:
+            self.update_queue.task_done()
+
+    async def _process_in_order(self, key):
+        pending = self._pending_by_key[key]
+        try:
+            while pending:
+                update = pending.popleft()
+                try:
+                    await self._process_in_slot(update)
+                except Exception:
+                    logger.exception("Failed to process update %s", update)
+        finally:
+            del self._pending_by_key[key]
+
+async def on_init(app):
+    from db.context import run_db
+    from service.tenants import load_tenants
+    from shared.reminders import start_reminders
+    await run_db(load_tenants)
+    await start_reporting()
+    await start_reminders(app)
+
+async def on_stop(app):
+    from shared.notifications import flush_notifications
+    await stop_reporting()
+    await flush_notifications()
+
+def build_application(builder=None, application_class=OrderedApplication):
+    from db.persistence import DatabasePersistence
+    from shared.main_menu import start
+    from flows.participation import participate_conv, schedule_handler, schedule_page_handler
+    from flows.cancellation import cancel_conv
+    from flows.admin import (
+        admin_add_template, admin_add_template_role, admin_conv, admin_export, admin_reload_templates,
+        admin_remove_template, admin_remove_template_role, admin_set_template_time, admin_stats,
+        admin_templates,
+    )
+    from flows.inline import inline_handler
+    builder = builder or ApplicationBuilder().token(TOKEN).request(
+        InstrumentedRequest(connection_pool_size=256)
+    )
+    app = (
+        builder.application_class(application_class)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .persistence(DatabasePersistence())
+        .post_init(on_init)
+        .post_stop(on_stop)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("templates", admin_templates))
+    app.add_handler(CommandHandler("settemplate", admin_set_template_time))
+    app.add_handler(CommandHandler("addtemplate", admin_add_template))
+    app.add_handler(CommandHandler("removetemplate", admin_remove_template))
+    app.add_handler(CommandHandler("addrole", admin_add_template_role))
+    app.add_handler(CommandHandler("removerole", admin_remove_template_role))
+    app.add_handler(CommandHandler("reloadtemplates", admin_reload_templates))
+    app.add_handler(CommandHandler("export", admin_export))
+    app.add_handler(CommandHandler("stats", admin_stats))
     app.add_handler(MessageHandler(filters.Regex("^Расписание$"), schedule_handler))
+    app.add_handler(CallbackQueryHandler(schedule_page_handler, pattern=r"^schedpage\|"))
     app.add_handler(participate_conv)
     app.add_handler(cancel_conv)
     app.add_handler(admin_conv)
-    app.run_polling()
+    app.add_handler(inline_handler)
+    instrument_application(app)
+    return app
+
+def main():
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        # Without it Telegram would never be told where to post updates.
+        raise SystemExit("BOT_MODE=webhook needs WEBHOOK_URL, the public base URL Telegram posts to")
+    from db_setup import default_engine, init_db
+    init_db()
+    instrument_engine(default_engine())
+    app = build_application()
+    if BOT_MODE == "webhook":
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
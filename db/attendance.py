@@ -0,0 +1,246 @@
+"""Attendance aggregates: per-user signups by month and per-role coverage by weekday.
+
+The signup and cancellation queries in db.queries update them in the same
+transaction as the participation itself; rebuild_attendance() recomputes
+them from history. Rebuild from the command line with:
+
+    python -m db.attendance
+"""
+import os
+import logging
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import case, delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+if __name__ == "__main__":
+    # Run as a script: load .env before db_setup and the settings below are read.
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from db_setup import (
+    Event, Participation, Role, RoleWeekdayStats, UserMonthStats, default_engine, event_roles
+)
+from db.dialect import dialect_insert
+from utils.times import event_start
+
+# A signup cancelled less than this long before the event counts as a no-show.
+LATE_CANCEL_HOURS = float(os.getenv("LATE_CANCEL_HOURS", "24"))
+# Events read per transaction by rebuild_attendance().
+ATTENDANCE_BACKFILL_CHUNK = int(os.getenv("ATTENDANCE_BACKFILL_CHUNK", "2000"))
+USER_KEYS = ["tenant_id", "month", "username"]
+ROLE_KEYS = ["tenant_id", "month", "weekday", "role_id"]
+
+logger = logging.getLogger(__name__)
+
+def month_of(day: date) -> date:
+    return day.replace(day=1)
+
+def _add_counts(session, model, keys, rows):
+    """Add the counters in ``rows`` to the aggregate rows with the same keys, creating missing ones."""
+    if not rows:
+        return
+    table = model.__table__
+    counters = [column for column in rows[0] if column not in keys]
+    stmt = dialect_insert(session, table)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys, set_={c: table.c[c] + stmt.excluded[c] for c in counters}
+        )
+        session.execute(stmt, rows)
+        return
+    for row in rows:
+        updated = session.execute(
+            update(table)
+            .where(*(table.c[k] == row[k] for k in keys))
+            .values({c: table.c[c] + row[c] for c in counters})
+        ).rowcount
+        if not updated:
+            session.execute(insert(table).values(**row))
+
+def key_matcher(columns, keys):
+    """Conditions matching ``keys`` (tuples of ``columns`` values), and a function matching a subset.
+
+    Columns holding one value in every key are compared once with "=", so the IN
+    lists, which SQLAlchemy expands on each call, carry only the other columns.
+    """
+    varying = [i for i in range(len(columns)) if len({key[i] for key in keys}) > 1] or [len(columns) - 1]
+    fixed = [column == keys[0][i] for i, column in enumerate(columns) if i not in varying]
+    if len(varying) == 1:
+        (i,) = varying
+        expr, project = columns[i], lambda key: key[i]
+    else:
+        expr, project = tuple_(*(columns[i] for i in varying)), lambda key: tuple(key[i] for i in varying)
+
+    def match(subset):
+        return expr.in_([project(key) for key in subset])
+    return fixed, match
+
+def _update_counts(session, model, keys, rows):
+    """Add the counters in ``rows`` to aggregate rows that already exist, in one UPDATE.
+
+    Each counter groups the rows by the value it adds, so the statement does not
+    grow with the number of rows and stays in SQLAlchemy's compiled cache.
+    """
+    if not rows:
+        return
+    table = model.__table__
+    counters = [column for column in rows[0] if column not in keys]
+    all_keys = [tuple(row[k] for k in keys) for row in rows]
+    fixed, match = key_matcher([table.c[k] for k in keys], all_keys)
+    values = {}
+    for c in counters:
+        by_value = {}
+        for key, row in zip(all_keys, rows):
+            by_value.setdefault(row[c], []).append(key)
+        # The largest group takes the ELSE branch and needs no IN list of its own.
+        *groups, (rest, _) = sorted(by_value.items(), key=lambda item: len(item[1]))
+        values[c] = table.c[c] + (case(*((match(group), n) for n, group in groups), else_=rest) if groups else rest)
+    session.execute(update(table).where(*fixed, match(all_keys)).values(values))
+
+def record_signup(session, tenant_id: int, event_date: date, role_id, username: str, first_in_role: bool):
+    month = month_of(event_date)
+    _add_counts(session, UserMonthStats, USER_KEYS, [
+        {"tenant_id": tenant_id, "month": month, "username": username, "served": 1, "late_cancels": 0}
+    ])
+    if role_id is not None:
+        _add_counts(session, RoleWeekdayStats, ROLE_KEYS, [{
+            "tenant_id": tenant_id, "month": month, "weekday": event_date.weekday(), "role_id": role_id,
+            "events": 0, "covered": int(first_in_role), "signups": 1,
+        }])
+
+def record_cancellations(session, tenant_id: int, parts, emptied, now: datetime):
+    """Count cancelled ``parts``; ``emptied`` holds the (event_id, role_id) pairs left without signups.
+
+    The aggregate rows exist since the signups were counted, so each table takes one UPDATE.
+    """
+    late_before = now + timedelta(hours=LATE_CANCEL_HOURS)
+    users, roles = {}, {}
+    # (month, weekday, late) per event date and time, shared by the signups at that slot.
+    slots, event_slots = {}, {}
+    for part in parts:
+        slot = slots.get((part.date, part.time))
+        if slot is None:
+            day = date.fromisoformat(part.date)
+            # An event without a valid time counts from the start of its day.
+            start = event_start(day, part.time) or datetime.combine(day, time())
+            slot = slots[(part.date, part.time)] = (month_of(day), day.weekday(), start <= late_before)
+        month, weekday, late = event_slots[part.event_id] = slot
+        counts = users.setdefault((month, part.username), [0, 0])
+        counts[0] -= 1
+        counts[1] += late
+        if part.role:
+            roles.setdefault((month, weekday, part.role.id), [0, 0])[1] -= 1
+    for event_id, role_id in emptied:
+        month, weekday, _ = event_slots[event_id]
+        roles.setdefault((month, weekday, role_id), [0, 0])[0] -= 1
+    _update_counts(session, UserMonthStats, USER_KEYS, [
+        {"tenant_id": tenant_id, "month": month, "username": username, "served": served, "late_cancels": late}
+        for (month, username), (served, late) in users.items()
+    ])
+    _update_counts(session, RoleWeekdayStats, ROLE_KEYS, [
+        {"tenant_id": tenant_id, "month": month, "weekday": weekday, "role_id": role_id,
+         "covered": covered, "signups": signups}
+        for (month, weekday, role_id), (covered, signups) in roles.items()
+    ])
+
+def record_new_event_roles(session, tenant_id: int, pairs):
+    """Count newly created events per role; ``pairs`` are (event date, role_id)."""
+    counts = Counter((month_of(day), day.weekday(), role_id) for day, role_id in pairs)
+    _add_counts(session, RoleWeekdayStats, ROLE_KEYS, [
+        {"tenant_id": tenant_id, "month": month, "weekday": weekday, "role_id": role_id,
+         "events": n, "covered": 0, "signups": 0}
+        for (month, weekday, role_id), n in counts.items()
+    ])
+
+def emptied_roles(session, pairs) -> set:
+    """Of the (event_id, role_id) ``pairs``, those whose seats are all free."""
+    if not pairs:
+        return set()
+    pairs = list(pairs)
+    fixed, match = key_matcher((event_roles.c.event_id, event_roles.c.role_id), pairs)
+    return set(session.execute(
+        select(event_roles.c.event_id, event_roles.c.role_id)
+        .where(*fixed, match(pairs), event_roles.c.taken == 0)
+    ).all())
+
+def rebuild_attendance(bind=None):
+    """Recompute the aggregates from events and participations, ATTENDANCE_BACKFILL_CHUNK events per transaction.
+
+    Late cancellations are not recorded anywhere else and are kept. Run it while
+    the bot is stopped, or signups made meanwhile may be counted twice.
+    """
+    bind = bind or default_engine()
+    chunks = 0
+    with Session(bind) as session:
+        session.execute(delete(RoleWeekdayStats))
+        session.execute(update(UserMonthStats).values(served=0))
+        session.commit()
+        last_id = 0
+        while True:
+            ids = session.execute(
+                select(Event.id).where(Event.id > last_id).order_by(Event.id).limit(ATTENDANCE_BACKFILL_CHUNK)
+            ).scalars().all()
+            if not ids:
+                break
+            in_chunk = Event.id.between(ids[0], ids[-1])
+            users = Counter(
+                (tenant_id, month_of(day), username)
+                for tenant_id, day, username in session.execute(
+                    select(Event.tenant_id, Event.date, Participation.username)
+                    .join(Participation, Participation.event_id == Event.id)
+                    .where(in_chunk)
+                )
+            )
+            roles = {}
+            for tenant_id, day, role_id, signups in session.execute(
+                select(Event.tenant_id, Event.date, event_roles.c.role_id, func.count(Participation.id))
+                .join(event_roles, event_roles.c.event_id == Event.id)
+                .outerjoin(Participation, (Participation.event_id == Event.id) & (Participation.role_id == event_roles.c.role_id))
+                .where(in_chunk)
+                .group_by(Event.id, event_roles.c.role_id)
+            ):
+                counts = roles.setdefault((tenant_id, month_of(day), day.weekday(), role_id), [0, 0, 0])
+                counts[0] += 1
+                counts[1] += signups > 0
+                counts[2] += signups
+            _add_counts(session, UserMonthStats, USER_KEYS, [
+                {"tenant_id": tenant_id, "month": month, "username": username, "served": n, "late_cancels": 0}
+                for (tenant_id, month, username), n in users.items()
+            ])
+            _add_counts(session, RoleWeekdayStats, ROLE_KEYS, [
+                {"tenant_id": tenant_id, "month": month, "weekday": weekday, "role_id": role_id,
+                 "events": events, "covered": covered, "signups": signups}
+                for (tenant_id, month, weekday, role_id), (events, covered, signups) in roles.items()
+            ])
+            session.commit()
+            last_id = ids[-1]
+            chunks += 1
+        session.execute(delete(UserMonthStats).where(UserMonthStats.served == 0, UserMonthStats.late_cancels == 0))
+        session.commit()
+    logger.info("Rebuilt attendance aggregates in %d chunks", chunks)
+
+def get_user_stats(session, tenant_id: int, since: date):
+    """(username, month, served, late cancels) from ``since`` on, by user and month."""
+    return session.execute(
+        select(UserMonthStats.username, UserMonthStats.month, UserMonthStats.served, UserMonthStats.late_cancels)
+        .where(UserMonthStats.tenant_id == tenant_id, UserMonthStats.month >= since)
+        .order_by(UserMonthStats.username, UserMonthStats.month)
+    ).all()
+
+def get_role_coverage(session, tenant_id: int, since: date):
+    """(weekday, role name, events, covered, signups) summed from ``since`` on."""
+    return session.execute(
+        select(
+            RoleWeekdayStats.weekday, Role.name, func.sum(RoleWeekdayStats.events),
+            func.sum(RoleWeekdayStats.covered), func.sum(RoleWeekdayStats.signups),
+        )
+        .join(Role, Role.id == RoleWeekdayStats.role_id)
+        .where(RoleWeekdayStats.tenant_id == tenant_id, RoleWeekdayStats.month >= since)
+        .group_by(RoleWeekdayStats.weekday, Role.id, Role.name)
+        .order_by(RoleWeekdayStats.weekday, Role.id)
+    ).all()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    rebuild_attendance()
@@ -1,10 +1,37 @@
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from db_setup import SessionLocal
+from db_setup import create_session
+from utils.metrics import record_session
+
+# Upper bound on blocking database calls running at the same time.
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
 
 @contextmanager
 def db_session():
-    session = SessionLocal()
+    record_session()
+    session = create_session()
     try:
         yield session
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking database function in the db executor, off the event loop."""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (e.g. the metrics handler call) into the worker thread.
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(_executor, call)
+
+def _with_session(query, *args, **kwargs):
+    with db_session() as session:
+        return query(session, *args, **kwargs)
+
+async def run_query(query, *args, **kwargs):
+    """Open a session in the db executor and call ``query(session, *args)`` with it."""
+    return await run_db(_with_session, query, *args, **kwargs)
@@ -0,0 +1,11 @@
+def dialect_insert(session, table):
+    """INSERT for ``table`` in the session's dialect, which supports ON CONFLICT; None on other databases."""
+    dialect = session.bind.dialect.name
+    # Imported here so only the dialect in use is loaded.
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(table)
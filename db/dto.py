@@ -1,23 +1,66 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional
 
-@dataclass
+# DTOs declare __slots__ so a cached week with many participations stays small.
+
+@dataclass(frozen=True)
 class RoleDTO:
+    __slots__ = ("id", "name")
     id: int
     name: str
 
 @dataclass
 class EventDTO:
+    __slots__ = ("id", "date", "slot", "name", "time", "roles", "seats", "participations")
     id: int
     date: str
     slot: str
     name: str
     time: str
     roles: List['RoleDTO']
+    seats: Dict[int, int]  # role id -> free seats, for roles with a capacity
     participations: List['ParticipationDTO']
 
+    def seats_left(self, role_id: int) -> Optional[int]:
+        """Free seats for the role, or None if it is unlimited."""
+        return self.seats.get(role_id)
+
 @dataclass
 class ParticipationDTO:
+    __slots__ = ("id", "username", "role")
+    id: int
+    username: str
+    role: Optional['RoleDTO']
+
+@dataclass
+class UserParticipationDTO:
+    """One of a user's signups, with the event fields the cancel flow shows."""
+    __slots__ = ("id", "username", "event_id", "date", "time", "event_name", "role")
     id: int
     username: str
-    role: Optional['RoleDTO']
\ No newline at end of file
+    event_id: int
+    date: str
+    time: str
+    event_name: str
+    role: Optional['RoleDTO']
+
+# Display order of the standard slots; any other template slot follows them.
+SLOT_ORDER = {"morning": 0, "evening": 1}
+
+class WeekView:
+    """Events for a run of dates indexed by (ISO date, slot), built once per schedule fetch."""
+    __slots__ = ("dates", "events", "by_slot", "by_date")
+
+    def __init__(self, dates, events: List[EventDTO]):
+        self.dates = [d.isoformat() for d in dates]
+        self.events = sorted(events, key=lambda e: (e.date, SLOT_ORDER.get(e.slot, len(SLOT_ORDER)), e.time))
+        self.by_slot = {(e.date, e.slot): e for e in self.events}
+        self.by_date = {}
+        for e in self.events:
+            self.by_date.setdefault(e.date, []).append(e)
+
+    def get(self, day: str, slot: str) -> Optional[EventDTO]:
+        return self.by_slot.get((day, slot))
+
+    def day(self, day: str) -> List[EventDTO]:
+        return self.by_date.get(day, [])
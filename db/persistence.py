@@ -0,0 +1,128 @@
+import os
+import json
+import asyncio
+from sqlalchemy import delete, insert, tuple_
+from telegram.ext import BasePersistence, PersistenceInput
+from db.context import run_query
+from db_setup import BotState
+
+# Seconds between periodic writes of changed user/chat/bot data and conversation states.
+# bot.OrderedApplication also writes them right after every update a conversation may handle.
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "60"))
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def _load_rows(session, kind: str) -> dict:
+    return dict(session.query(BotState.key, BotState.data).filter(BotState.kind == kind))
+
+def _write_rows(session, rows: dict):
+    # rows maps (kind, key) to JSON, or to None to delete the row. All of them are
+    # replaced in one transaction: one delete, then one multi-row insert.
+    session.execute(delete(BotState).where(tuple_(BotState.kind, BotState.key).in_(list(rows))))
+    stored = [{"kind": kind, "key": key, "data": data} for (kind, key), data in rows.items() if data is not None]
+    if stored:
+        session.execute(insert(BotState), stored)
+    session.commit()
+
+class DatabasePersistence(BasePersistence):
+    """Keeps user/chat data and conversation states in the bot database.
+
+    Values are stored as compact JSON, so handlers keep only ids, dates and
+    flags in user_data/chat_data and re-read events from the week cache.
+    """
+
+    def __init__(self, update_interval: float = STATE_FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(callback_data=False), update_interval=update_interval
+        )
+        # Hash of the last written JSON per (kind, key), so unchanged data is not written again.
+        self._last = {}
+        # Rows waiting for the next batch, and the task that will write them.
+        self._pending = {}
+        self._batch = None
+
+    async def _load(self, kind: str) -> dict:
+        rows = await run_query(_load_rows, kind)
+        for key, data in rows.items():
+            self._last[(kind, key)] = hash(data)
+        return {key: json.loads(data) for key, data in rows.items()}
+
+    async def _write_batch(self):
+        await asyncio.sleep(0)  # let the other writes of this persistence run join the batch
+        rows, self._pending, self._batch = self._pending, {}, None
+        await run_query(_write_rows, rows)
+
+    async def _write(self, kind: str, key: str, data):
+        # Writes issued together, e.g. by one Application.update_persistence() run, share a transaction.
+        self._pending[(kind, key)] = data
+        if self._batch is None:
+            self._batch = asyncio.ensure_future(self._write_batch())
+        await self._batch
+
+    async def _store(self, kind: str, key: str, value):
+        # Empty dicts are not stored; a row that becomes empty is deleted.
+        data = _dumps(value) if value != {} else None
+        if self._last.get((kind, key)) == (data and hash(data)):
+            return
+        if data is None:
+            return await self._delete(kind, key)
+        self._last[(kind, key)] = hash(data)
+        await self._write(kind, key, data)
+
+    async def _delete(self, kind: str, key: str):
+        self._last.pop((kind, key), None)
+        await self._write(kind, key, None)
+
+    async def get_user_data(self):
+        return {int(k): v for k, v in (await self._load("user")).items()}
+
+    async def get_chat_data(self):
+        return {int(k): v for k, v in (await self._load("chat")).items()}
+
+    async def get_bot_data(self):
+        return (await self._load("bot")).get("", {})
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        rows = await self._load(f"conv:{name}")
+        return {tuple(json.loads(k)): state for k, state in rows.items()}
+
+    async def update_user_data(self, user_id, data):
+        await self._store("user", str(user_id), data)
+
+    async def update_chat_data(self, chat_id, data):
+        await self._store("chat", str(chat_id), data)
+
+    async def update_bot_data(self, data):
+        await self._store("bot", "", data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        kind, key = f"conv:{name}", _dumps(list(key))
+        if new_state is None:
+            await self._delete(kind, key)
+        else:
+            await self._store(kind, key, new_state)
+
+    async def drop_user_data(self, user_id):
+        await self._delete("user", str(user_id))
+
+    async def drop_chat_data(self, chat_id):
+        await self._delete("chat", str(chat_id))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        pass
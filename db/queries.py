@@ -1,72 +1,292 @@
-from db_setup import Event, Role, Participation
-from db.dto import EventDTO, RoleDTO, ParticipationDTO
-from sqlalchemy.orm import joinedload
-from typing import List
-from datetime import date
-
-def to_role_dto(role: Role) -> RoleDTO:
-    return RoleDTO(id=role.id, name=role.name)
-
-def to_participation_dto(part: Participation) -> ParticipationDTO:
-    return ParticipationDTO(
-        id=part.id,
-        username=part.username,
-        role=to_role_dto(part.role) if part.role else None,
-    )
+import sys
+from collections import Counter
+from db_setup import Event, Role, Participation, event_roles, skipped_indexes
+from db.attendance import emptied_roles, key_matcher, record_cancellations, record_signup
+from db.dialect import dialect_insert
+from db.dto import EventDTO, RoleDTO, ParticipationDTO, UserParticipationDTO
+from sqlalchemy import case, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from typing import List, Optional
+from datetime import date, datetime
+
+# Role DTOs are immutable, so one instance per (id, name) is shared by every event.
+_role_dtos = {}
+
+def _role_dto(role_id: int, name: str) -> RoleDTO:
+    key = (role_id, name)
+    role = _role_dtos.get(key)
+    if role is None:
+        role = _role_dtos[key] = RoleDTO(id=role_id, name=name)
+    return role
+
+def _load_events(session, condition) -> List[EventDTO]:
+    """Build event DTOs from three flat column queries instead of joined ORM rows."""
+    events = {
+        event_id: EventDTO(
+            id=event_id,
+            date=event_date.isoformat(),
+            slot=sys.intern(slot),
+            name=name,
+            time=time,
+            roles=[],
+            seats={},
+            participations=[],
+        )
+        for event_id, event_date, slot, name, time in session.execute(
+            select(Event.id, Event.date, Event.slot, Event.name, Event.time)
+            .where(condition)
+            .order_by(Event.date, Event.slot)
+        )
+    }
+    if not events:
+        return []
+    ids = list(events)
+    roles = {}
+    for event_id, role_id, role_name, capacity, taken in session.execute(
+        select(event_roles.c.event_id, Role.id, Role.name, event_roles.c.capacity, event_roles.c.taken)
+        .join(Role, Role.id == event_roles.c.role_id)
+        .where(event_roles.c.event_id.in_(ids))
+        .order_by(event_roles.c.event_id, Role.id)
+    ):
+        roles[role_id] = _role_dto(role_id, role_name)
+        events[event_id].roles.append(roles[role_id])
+        if capacity is not None:
+            events[event_id].seats[role_id] = max(0, capacity - taken)
+    parts = session.execute(
+        select(Participation.id, Participation.event_id, Participation.username, Participation.role_id)
+        .where(Participation.event_id.in_(ids))
+        .order_by(Participation.id)
+    ).all()
+    missing = {role_id for _, _, _, role_id in parts if role_id is not None and role_id not in roles}
+    if missing:
+        for role_id, role_name in session.execute(select(Role.id, Role.name).where(Role.id.in_(missing))):
+            roles[role_id] = _role_dto(role_id, role_name)
+    for part_id, event_id, username, role_id in parts:
+        events[event_id].participations.append(
+            ParticipationDTO(id=part_id, username=username, role=roles.get(role_id))
+        )
+    return list(events.values())
 
-def to_event_dto(event: Event) -> EventDTO:
-    return EventDTO(
-        id=event.id,
-        date=event.date.isoformat(),
-        slot=event.slot,
-        name=event.name,
-        time=event.time,
-        roles=[to_role_dto(role) for role in event.roles],
-        participations=[to_participation_dto(part) for part in event.participations],
+def get_events_for_dates(session, tenant_id: int, dates: List[date]) -> List[EventDTO]:
+    return _load_events(session, (Event.tenant_id == tenant_id) & Event.date.in_(dates))
+
+def get_event_by_id(session, tenant_id: int, event_id: int) -> EventDTO:
+    events = _load_events(session, (Event.tenant_id == tenant_id) & (Event.id == event_id))
+    return events[0] if events else None
+
+def get_or_create_roles(session, tenant_id: int, role_names: List[str]) -> List[Role]:
+    """Resolve roles by name in one query; missing ones are flushed but not committed."""
+    by_name = {
+        role.name: role
+        for role in session.query(Role).filter(Role.tenant_id == tenant_id, Role.name.in_(role_names))
+    }
+    for name in role_names:
+        if name not in by_name:
+            by_name[name] = Role(tenant_id=tenant_id, name=name)
+            session.add(by_name[name])
+    session.flush()
+    return [by_name[name] for name in role_names]
+
+# Outcomes of add_participation.
+SIGNED_UP, ALREADY_SIGNED_UP, ROLE_FULL = range(3)
+
+def _insert_participation(session, values) -> bool:
+    if "ux_participations_event_role_user" in skipped_indexes:
+        # Without the unique index ON CONFLICT has nothing to match and duplicates
+        # raise no IntegrityError, so look for the signup first.
+        exists = session.execute(
+            select(Participation.id).where(
+                Participation.event_id == values["event_id"],
+                Participation.role_id == values["role_id"],
+                Participation.username == values["username"],
+            ).limit(1)
+        ).first()
+        if exists:
+            return False
+        session.execute(insert(Participation).values(**values))
+        return True
+    stmt = dialect_insert(session, Participation)
+    if stmt is not None:
+        stmt = stmt.values(**values).on_conflict_do_nothing(index_elements=["event_id", "role_id", "username"])
+        return session.execute(stmt).rowcount == 1
+    try:
+        session.execute(insert(Participation).values(**values))
+    except IntegrityError:
+        return False
+    return True
+
+def add_participation(session, event_id: int, role_id: int, username: str, chat_id: int = None) -> int:
+    """Sign ``username`` up for a seat in the event role.
+
+    The participation and the seat are taken in one transaction. The seat is a
+    conditional increment of event_roles.taken, which the database applies to one
+    row at a time, so parallel signups cannot exceed capacity and nothing else is
+    locked. The attendance aggregates are updated in the same transaction.
+    Returns SIGNED_UP, ALREADY_SIGNED_UP or ROLE_FULL.
+    """
+    values = {"event_id": event_id, "role_id": role_id, "username": username, "chat_id": chat_id}
+    if not _insert_participation(session, values):
+        session.rollback()
+        return ALREADY_SIGNED_UP
+    seat = session.execute(
+        update(event_roles)
+        .where(
+            event_roles.c.event_id == event_id,
+            event_roles.c.role_id == role_id,
+            or_(event_roles.c.capacity.is_(None), event_roles.c.taken < event_roles.c.capacity),
+        )
+        .values(taken=event_roles.c.taken + 1)
     )
+    if seat.rowcount != 1:
+        session.rollback()
+        return ROLE_FULL
+    tenant_id, event_date, taken = session.execute(
+        select(Event.tenant_id, Event.date, event_roles.c.taken)
+        .join(event_roles, event_roles.c.event_id == Event.id)
+        .where(Event.id == event_id, event_roles.c.role_id == role_id)
+    ).one()
+    record_signup(session, tenant_id, event_date, role_id, username, first_in_role=taken == 1)
+    session.commit()
+    return SIGNED_UP
 
-def get_events_for_dates(session, dates: List[date]) -> List[EventDTO]:
-    events = (
-        session.query(Event)
-        .options(
-            joinedload(Event.roles),
-            joinedload(Event.participations).joinedload(Participation.role),
+def set_role_capacity(session, tenant_id: int, event_id: int, role_id: int, capacity: Optional[int]) -> Optional[date]:
+    """Set the seats of a role in one of the tenant's events; None lifts the limit.
+
+    Existing signups above a lowered capacity are kept. Returns the event date, or
+    None if the event or role does not exist.
+    """
+    event_date = session.execute(
+        select(Event.date).where(Event.id == event_id, Event.tenant_id == tenant_id)
+    ).scalar()
+    if event_date is None:
+        return None
+    updated = session.execute(
+        update(event_roles)
+        .where(event_roles.c.event_id == event_id, event_roles.c.role_id == role_id)
+        .values(capacity=capacity)
+    ).rowcount
+    session.commit()
+    return event_date if updated else None
+
+def _user_participations(session, condition) -> List[UserParticipationDTO]:
+    # One flat join; ix_participations_username_event serves it whichever table the
+    # planner starts from: by user, or per event by (user, event).
+    rows = session.execute(
+        select(
+            Participation.id, Participation.username, Participation.event_id,
+            Event.date, Event.time, Event.name, Role.id, Role.name,
         )
-        .filter(Event.date.in_(dates))
-        .order_by(Event.date, Event.slot)
-        .all()
+        .join(Event, Event.id == Participation.event_id)
+        .outerjoin(Role, Role.id == Participation.role_id)
+        .where(condition)
+        .order_by(Event.date, Event.slot, Participation.id)
     )
-    return [to_event_dto(e) for e in events]
-
-def get_event_by_id(session, event_id: int) -> EventDTO:
-    event = (
-        session.query(Event)
-        .options(
-            joinedload(Event.roles),
-            joinedload(Event.participations).joinedload(Participation.role),
+    return [
+        UserParticipationDTO(
+            id=part_id,
+            username=username,
+            event_id=event_id,
+            date=event_date.isoformat(),
+            time=time,
+            event_name=event_name,
+            role=_role_dto(role_id, role_name) if role_id is not None else None,
         )
-        .filter_by(id=event_id)
-        .first()
+        for part_id, username, event_id, event_date, time, event_name, role_id, role_name in rows
+    ]
+
+def get_upcoming_participations(session, tenant_id: int, username: str, today: date) -> List[UserParticipationDTO]:
+    """``username``'s signups for the tenant's events on or after ``today``, in event order."""
+    return _user_participations(
+        session,
+        (Participation.username == username) & (Event.tenant_id == tenant_id) & (Event.date >= today),
     )
-    return to_event_dto(event) if event else None
-
-def get_or_create_role(session, role_name: str) -> Role:
-    role = session.query(Role).filter_by(name=role_name).first()
-    if not role:
-        role = Role(name=role_name)
-        session.add(role)
-        session.commit()
-    return role
 
-def get_participations_for_username(session, username: str, after_date: date) -> List[ParticipationDTO]:
-    parts = (
-        session.query(Participation)
-        .join(Event)
-        .filter(
-            Participation.username == username,
-            Event.date >= today
+def _free_seats(session, parts: List[UserParticipationDTO]) -> set:
+    """Give back the seats of ``parts``; returns the (event_id, role_id) pairs left with none taken."""
+    freed = Counter((p.event_id, p.role.id) for p in parts if p.role)
+    if not freed:
+        return set()
+    # One statement for any number of seats: pairs are grouped by how many seats
+    # they free, which is one for all of them unless a user signed up twice.
+    by_count = {}
+    for pair, count in freed.items():
+        by_count.setdefault(count, []).append(pair)
+    fixed, match = key_matcher((event_roles.c.event_id, event_roles.c.role_id), list(freed))
+    *groups, (released, _) = sorted(by_count.items(), key=lambda item: len(item[1]))
+    if groups:
+        released = case(*((match(pairs), count) for count, pairs in groups), else_=released)
+    stmt = update(event_roles).where(*fixed, match(freed)).values(taken=event_roles.c.taken - released)
+    if session.bind.dialect.update_returning:
+        # The updated counts tell which roles were left empty without another query.
+        rows = session.execute(stmt.returning(event_roles.c.event_id, event_roles.c.role_id, event_roles.c.taken))
+        return {(event_id, role_id) for event_id, role_id, taken in rows if taken == 0}
+    session.execute(stmt)
+    return emptied_roles(session, freed)
+
+def _delete_returning(session, tenant_id: int, parts: List[UserParticipationDTO]) -> List[UserParticipationDTO]:
+    """Delete ``parts`` in one statement, free their seats, and return those this call actually removed."""
+    if not parts:
+        return []
+    stmt = delete(Participation).where(Participation.id.in_([p.id for p in parts]))
+    if session.bind.dialect.delete_returning:
+        deleted = set(session.execute(stmt.returning(Participation.id)).scalars())
+        parts = [p for p in parts if p.id in deleted]
+    else:
+        session.execute(stmt)
+    emptied = _free_seats(session, parts)
+    record_cancellations(session, tenant_id, parts, emptied, datetime.now())
+    session.commit()
+    return parts
+
+def delete_participation(session, tenant_id: int, part_id: int, username: str) -> Optional[UserParticipationDTO]:
+    """Delete one of ``username``'s signups; None if it does not exist or is not theirs."""
+    parts = _user_participations(
+        session,
+        (Participation.id == part_id) & (Participation.username == username) & (Event.tenant_id == tenant_id),
+    )
+    deleted = _delete_returning(session, tenant_id, parts)
+    return deleted[0] if deleted else None
+
+def delete_upcoming_participations(session, tenant_id: int, username: str, today: date) -> List[UserParticipationDTO]:
+    """Cancel all of ``username``'s upcoming signups: one select and one bulk delete."""
+    return _delete_returning(session, tenant_id, get_upcoming_participations(session, tenant_id, username, today))
+
+def iter_export_rows(session, tenant_id: int, start: date, end: date, chunk_size: int = 1000):
+    """Stream (event_id, date, time, slot, name, role name, username) for the tenant's events
+    from ``start`` to ``end`` inclusive, by date and time, fetching ``chunk_size`` rows at a time.
+
+    Events without signups yield one row with role and username unset.
+    """
+    stmt = (
+        select(
+            Event.id, Event.date, Event.time, Event.slot, Event.name, Role.name, Participation.username,
         )
-        .order_by(Event.date, Event.slot)
+        .outerjoin(Participation, Participation.event_id == Event.id)
+        .outerjoin(Role, Role.id == Participation.role_id)
+        .where(Event.tenant_id == tenant_id, Event.date >= start, Event.date <= end)
+        # Only the rows of one date are sorted at a time; the index already orders by date.
+        .order_by(Event.date, Event.time, Event.id, Participation.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    yield from session.execute(stmt)
+
+def get_reminder_rows(session, today: date):
+    """(event_id, date, time, name, role_id, role name, username, chat_id) for upcoming signups of every tenant."""
+    return (
+        session.query(
+            Event.id, Event.date, Event.time, Event.name,
+            Participation.role_id, Role.name, Participation.username, Participation.chat_id,
+        )
+        .join(Participation, Participation.event_id == Event.id)
+        .outerjoin(Role, Role.id == Participation.role_id)
+        .filter(Event.date >= today, Participation.chat_id.is_not(None))
         .all()
     )
-    return [to_participation_dto(p) for p in parts]
\ No newline at end of file
+
+def set_event_time(session, tenant_id: int, event_id: int, new_time: str) -> Optional[date]:
+    event = session.query(Event).filter_by(id=event_id, tenant_id=tenant_id).first()
+    if not event:
+        return None
+    event.time = new_time
+    session.commit()
+    return event.date
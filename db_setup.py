@@ -1,28 +1,77 @@
 import os
+import logging
+import threading
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Date, ForeignKey, Table
+    create_engine, event, inspect, text, BigInteger, Column, Integer, String, Date, ForeignKey, Table,
+    Index, func, select
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+if __name__ == "__main__":
+    # Run as a script: load .env before the settings below are read.
+    from dotenv import load_dotenv
+    load_dotenv()
+
 DB_NAME = os.getenv("DB_NAME", "music_schedule.db")
+# "production" turns on WAL and the other SQLite pragmas below and sizes the pool
+# for the db executor; "default" keeps SQLAlchemy's stock engine.
+DB_PROFILE = os.getenv("DB_PROFILE", "default")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", os.getenv("DB_MAX_WORKERS", "4")))
+# Admins of the default tenant; other tenants keep theirs in tenant_admins.
 ADMIN_IDS = set(int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip())
+# The congregation a single-group install always had; rows from before tenancy belong to it.
+DEFAULT_TENANT_ID = 1
+
+logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
-# Association table for many-to-many Event <-> Role
+class Tenant(Base):
+    """A group using the bot. Its chat_id is the Telegram group it was registered from."""
+    __tablename__ = "tenants"
+    __table_args__ = (Index("ux_tenants_chat_id", "chat_id", unique=True),)
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(BigInteger, nullable=True)  # unset for the default tenant
+    title = Column(String, nullable=True)
+
+tenant_admins = Table(
+    "tenant_admins",
+    Base.metadata,
+    Column("tenant_id", Integer, ForeignKey("tenants.id"), primary_key=True),
+    Column("user_id", BigInteger, primary_key=True)
+)
+
+def tenant_column():
+    return Column(
+        Integer, ForeignKey("tenants.id"), nullable=False, server_default=str(DEFAULT_TENANT_ID)
+    )
+
+# Association table for many-to-many Event <-> Role, with the role's seats in the event.
+# taken counts the role's participations and is maintained by db.queries on every
+# signup and cancellation, so free seats are read without counting rows.
 event_roles = Table(
     "event_roles",
     Base.metadata,
     Column("event_id", Integer, ForeignKey("events.id"), primary_key=True),
-    Column("role_id", Integer, ForeignKey("roles.id"), primary_key=True)
+    Column("role_id", Integer, ForeignKey("roles.id"), primary_key=True),
+    Column("capacity", Integer, nullable=True),  # unset means unlimited
+    Column("taken", Integer, nullable=False, server_default="0"),
+)
+
+# Association table for many-to-many EventTemplate <-> Role; capacity is copied to new events.
+template_roles = Table(
+    "template_roles",
+    Base.metadata,
+    Column("template_id", Integer, ForeignKey("event_templates.id"), primary_key=True),
+    Column("role_id", Integer, ForeignKey("roles.id"), primary_key=True),
+    Column("capacity", Integer, nullable=True),
 )
 
 class Role(Base):
     __tablename__ = "roles"
+    __table_args__ = (Index("ux_roles_tenant_name", "tenant_id", "name", unique=True),)
     id = Column(Integer, primary_key=True)
+    tenant_id = tenant_column()
     name = Column(String, nullable=False)
 
     participations = relationship("Participation", back_populates="role")
@@ -30,35 +79,260 @@ class Role(Base):
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (Index("ux_events_tenant_date_slot", "tenant_id", "date", "slot", unique=True),)
     id = Column(Integer, primary_key=True)
+    tenant_id = tenant_column()
     date = Column(Date, nullable=False)
-    slot = Column(String, nullable=False)  # "morning" or "evening"
+    slot = Column(String, nullable=False)  # template slot, e.g. "morning" or "evening"
     name = Column(String, nullable=False)
     time = Column(String, nullable=False)
 
     roles = relationship("Role", secondary=event_roles, back_populates="events")
     participations = relationship("Participation", back_populates="event")
 
+class EventTemplate(Base):
+    """Weekly recurrence rule: one event per matching weekday and slot."""
+    __tablename__ = "event_templates"
+    __table_args__ = (
+        Index("ux_event_templates_tenant_weekday_slot", "tenant_id", "weekday", "slot", unique=True),
+    )
+    id = Column(Integer, primary_key=True)
+    tenant_id = tenant_column()
+    weekday = Column(Integer, nullable=False)  # 0 = Monday
+    slot = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    time = Column(String, nullable=False)
+
+    roles = relationship("Role", secondary=template_roles)
+
 class Participation(Base):
     __tablename__ = "participations"
+    __table_args__ = (
+        Index("ix_participations_username_event", "username", "event_id"),
+        Index("ux_participations_event_role_user", "event_id", "role_id", "username", unique=True),
+    )
     id = Column(Integer, primary_key=True)
     username = Column(String, nullable=False)
     event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
     role_id = Column(Integer, ForeignKey("roles.id"), nullable=True)
+    chat_id = Column(BigInteger, nullable=True)  # where reminders go; unset for older signups
 
     event = relationship("Event", back_populates="participations")
     role = relationship("Role", back_populates="participations")
 
-def get_engine():
+class UserMonthStats(Base):
+    """Per-user attendance by event month, kept up to date on every signup and cancellation."""
+    __tablename__ = "user_month_stats"
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), primary_key=True)
+    month = Column(Date, primary_key=True)  # first day of the month
+    username = Column(String, primary_key=True)
+    served = Column(Integer, nullable=False, server_default="0")  # signups not cancelled
+    late_cancels = Column(Integer, nullable=False, server_default="0")  # cancelled shortly before the event
+
+class RoleWeekdayStats(Base):
+    """Per-role coverage by event month and weekday, kept up to date like UserMonthStats."""
+    __tablename__ = "role_weekday_stats"
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    weekday = Column(Integer, primary_key=True)  # 0 = Monday
+    role_id = Column(Integer, ForeignKey("roles.id"), primary_key=True)
+    events = Column(Integer, nullable=False, server_default="0")  # events offering the role
+    covered = Column(Integer, nullable=False, server_default="0")  # of those, with at least one signup
+    signups = Column(Integer, nullable=False, server_default="0")
+
+class BotState(Base):
+    """Persisted bot state: user/chat/bot data and conversation states as JSON."""
+    __tablename__ = "bot_state"
+    kind = Column(String, primary_key=True)  # "user", "chat", "bot" or "conv:<name>"
+    key = Column(String, primary_key=True)
+    data = Column(String, nullable=False)
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # readers no longer block the writer, and vice versa
+    "synchronous": "NORMAL",  # safe with WAL; fsync at checkpoints only
+    "busy_timeout": 5000,  # ms to wait for a lock before "database is locked"
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # KiB
+    "temp_store": "MEMORY",
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def get_engine(profile: str = None, db_name: str = None):
+    profile = profile or DB_PROFILE
+    db_name = db_name or DB_NAME
     # Support both sqlite and other DBs via URL if desired
-    if DB_NAME.startswith("sqlite:///") or DB_NAME.endswith(".db"):
-        db_url = f"sqlite:///{DB_NAME}" if not DB_NAME.startswith("sqlite:///") else DB_NAME
+    if db_name.startswith("sqlite:///") or db_name.endswith(".db"):
+        db_url = f"sqlite:///{db_name}" if not db_name.startswith("sqlite:///") else db_name
     else:
-        db_url = DB_NAME  # Assume full SQLAlchemy URL if not sqlite
-    return create_engine(db_url, echo=False, future=True)
+        db_url = db_name  # Assume full SQLAlchemy URL if not sqlite
+    if profile != "production":
+        return create_engine(db_url, echo=False, future=True)
+    if db_url.startswith("sqlite"):
+        # One connection per db worker thread; SQLite has a single writer anyway.
+        engine = create_engine(
+            db_url, echo=False, future=True,
+            pool_size=DB_POOL_SIZE, max_overflow=0, pool_timeout=30,
+            connect_args={"timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000},
+        )
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+        return engine
+    return create_engine(
+        db_url, echo=False, future=True,
+        pool_size=DB_POOL_SIZE, max_overflow=DB_POOL_SIZE, pool_pre_ping=True, pool_recycle=1800,
+    )
+
+# Created on first use, so importing the models never opens a database.
+_engine = None
+_session_factory = None
+_engine_lock = threading.Lock()
+
+def default_engine():
+    """The application's engine, created from DB_NAME/DB_PROFILE on first call."""
+    global _engine, _session_factory
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = get_engine()
+                _session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+                _engine = engine
+    return _engine
+
+def create_session():
+    default_engine()
+    return _session_factory()
+
+def _duplicate_count(conn, table, columns) -> int:
+    # Unique indexes allow repeated rows that hold a NULL in any indexed column.
+    dupes = (
+        select(*columns)
+        .select_from(table)
+        .where(*(column.is_not(None) for column in columns))
+        .group_by(*columns)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    return conn.execute(select(func.count()).select_from(dupes)).scalar()
 
-engine = get_engine()
-SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
+def upgrade_columns(bind=None) -> set:
+    """Add columns declared after a table was created, if they are nullable or have a default.
+
+    Returns the added columns as (table, column) names.
+    """
+    bind = bind or default_engine()
+    added = set()
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not (column.nullable or column.server_default):
+                    continue
+                ddl = f"{column.name} {column.type.compile(dialect=conn.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                logger.info("Added column %s.%s", table.name, column.name)
+                added.add((table.name, column.name))
+    return added
+
+def recount_seats(bind=None):
+    """Reset every event role's taken counter to its number of participations."""
+    bind = bind or default_engine()
+    count = (
+        select(func.count())
+        .where(
+            Participation.event_id == event_roles.c.event_id,
+            Participation.role_id == event_roles.c.role_id,
+        )
+        .scalar_subquery()
+    )
+    with bind.begin() as conn:
+        conn.execute(event_roles.update().values(taken=count))
+
+def remove_duplicate_participations(bind=None) -> int:
+    """Collapse repeated signups of a user for the same event role to their oldest row.
+
+    Signups without a role are left alone, as the unique index allows them.
+    Returns the number of rows deleted.
+    """
+    bind = bind or default_engine()
+    columns = [Participation.event_id, Participation.role_id, Participation.username]
+    keep = select(func.min(Participation.id)).where(Participation.role_id.is_not(None)).group_by(*columns)
+    with bind.begin() as conn:
+        deleted = conn.execute(
+            Participation.__table__.delete()
+            .where(Participation.role_id.is_not(None), Participation.id.not_in(keep))
+        ).rowcount
+    logger.info("Removed %d duplicate participations", deleted)
+    return deleted
+
+# Names of the unique indexes upgrade_indexes() had to skip. db.queries does not
+# rely on them for ON CONFLICT while they are missing.
+skipped_indexes = set()
+
+def upgrade_indexes(bind=None):
+    """Add the declared indexes to a database created before they existed.
+
+    Unique indexes are skipped with a warning if existing rows violate them, and
+    recorded in skipped_indexes; duplicate participations are removed with
+    `python db_setup.py --remove-duplicates`.
+    """
+    bind = bind or default_engine()
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.unique and _duplicate_count(conn, table, list(index.columns)):
+                    hint = " (run python db_setup.py --remove-duplicates)" if table is Participation.__table__ else ""
+                    logger.warning("Skipping %s: existing rows are not unique%s", index.name, hint)
+                    skipped_indexes.add(index.name)
+                    continue
+                index.create(bind=conn, checkfirst=True)
+                skipped_indexes.discard(index.name)
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    """Create missing tables, columns and indexes. Run once at startup, before serving."""
+    engine = default_engine()
+    inspector = inspect(engine)
+    new_stats = not inspector.has_table(UserMonthStats.__tablename__)
+    new_templates = not inspector.has_table(EventTemplate.__tablename__)
+    upgraded = inspector.has_table(Event.__tablename__)
+    Base.metadata.create_all(bind=engine)
+    added = upgrade_columns(engine)
+    upgrade_indexes(engine)
+    if ("event_roles", "taken") in added:
+        recount_seats(engine)
+    with engine.begin() as conn:
+        if conn.execute(select(Tenant.id).where(Tenant.id == DEFAULT_TENANT_ID)).first() is None:
+            conn.execute(Tenant.__table__.insert().values(id=DEFAULT_TENANT_ID))
+    if new_templates:
+        # Imported here: the schedule service itself imports the models above.
+        from service.schedule_service import seed_default_templates
+        # A database from before templates keeps its roles unlimited.
+        seed_default_templates(DEFAULT_TENANT_ID, capacities=not upgraded)
+    if new_stats:
+        # Imported here: db.attendance itself imports the models above.
+        from db.attendance import rebuild_attendance
+        rebuild_attendance(engine)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Create or upgrade the bot's database.")
+    parser.add_argument(
+        "--remove-duplicates", action="store_true",
+        help="also delete repeated signups of a user for the same event role, keeping the oldest",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    if args.remove_duplicates and remove_duplicate_participations():
+        from db.attendance import rebuild_attendance
+        upgrade_indexes()
+        recount_seats()
+        rebuild_attendance()
\ No newline at end of file
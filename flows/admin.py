@@ -1,41 +1,44 @@
+from datetime import datetime
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ConversationHandler, CallbackQueryHandler, MessageHandler, filters
 )
 from shared.cancel import cancel_handler
-from shared.main_menu import show_main_menu
-from service.schedule_service import ensure_week_events, get_week_schedule, week_dates
-from utils.formatting import ru_date_string
-from db.context import db_session
-from db_setup import Event
-
-from datetime import datetime
+from shared.main_menu import show_main_menu, main_menu_markup
+from shared.reminders import reschedule_event
+from service.schedule_service import (
+    ensure_week_events, get_event, get_templates, get_week_view, invalidate_week_schedule,
+    reload_templates, remove_template, remove_template_role, save_template, set_template_role,
+    set_template_time
+)
+from utils.formatting import WEEKDAY_RU, ru_date_string, get_role_label
+from utils.times import parse_time
+from db.context import run_db, run_query
+from db.queries import set_event_time, set_role_capacity
+from service.export import EXPORT_FORMATS, export_schedule
+from service.attendance import ATTENDANCE_REPORT_MONTHS, attendance_report
+from service.tenants import current_tenant, is_admin
 
-MANAGE_EVENT_SELECT, EDIT_EVENT_CHOICE, SET_EVENT_TIME = range(10, 13)
+MANAGE_EVENT_SELECT, EDIT_EVENT_CHOICE, SET_EVENT_TIME, CHOOSE_CAPACITY_ROLE, SET_ROLE_CAPACITY = range(10, 15)
+# Typed answers; "Отмена" is left to the fallback, as state handlers are checked first.
+ANSWER = filters.TEXT & ~filters.COMMAND & ~filters.Regex("^Отмена$")
 
 async def admin(update, context):
-    ensure_week_events()
-    event_dtos = get_week_schedule()
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return ConversationHandler.END
+    await run_db(ensure_week_events, tenant_id)
+    view = await run_db(get_week_view, tenant_id)
     keyboard = []
-    for date in week_dates():
-        for slot in ["morning", "evening"]:
-            event = next(
-                (
-                    e
-                    for e in event_dtos
-                    if datetime.fromisoformat(e.date).date() == date and e.slot == slot
-                ),
-                None,
-            )
-            if event:
-                btn_text = f"{ru_date_string(event.date)}, {slot.capitalize()} ({event.time})"
-                keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"manageevent|{event.id}")])
+    for date in view.dates:
+        for event in view.day(date):
+            btn_text = f"{ru_date_string(event.date)}, {event.slot.capitalize()} ({event.time})"
+            keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"manageevent|{event.id}")])
     keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel")])
     await update.message.reply_text(
         "Выберите событие для изменения времени:",
         reply_markup=InlineKeyboardMarkup(keyboard),
     )
-    await show_main_menu(update, context)
     return MANAGE_EVENT_SELECT
 
 async def admin_manage_event_select(update, context):
@@ -45,6 +48,7 @@ async def admin_manage_event_select(update, context):
     context.user_data["admin_event_id"] = int(event_id)
     keyboard = [
         [InlineKeyboardButton("Изменить время", callback_data="edittime")],
+        [InlineKeyboardButton("Изменить число мест", callback_data="editcapacity")],
         [InlineKeyboardButton("Отмена", callback_data="cancel")]
     ]
     await update.callback_query.edit_message_text(
@@ -58,25 +62,254 @@ async def admin_edit_event_choice(update, context):
     if data == "edittime":
         await update.callback_query.edit_message_text("Введите новое время события (HH:MM):")
         return SET_EVENT_TIME
+    elif data == "editcapacity":
+        event = await run_db(get_event, current_tenant(context), context.user_data.get("admin_event_id"))
+        if not event or not event.roles:
+            await update.callback_query.edit_message_text("В этом событии нет ролей.")
+            await show_main_menu(update, context)
+            return ConversationHandler.END
+        keyboard = [
+            [InlineKeyboardButton(get_role_label(event, role), callback_data=f"capacityrole|{role.id}")]
+            for role in event.roles
+        ]
+        keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel")])
+        await update.callback_query.edit_message_text(
+            "Выберите роль:", reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        return CHOOSE_CAPACITY_ROLE
     else:
         await update.callback_query.edit_message_text("Редактирование отменено.")
         await show_main_menu(update, context)
         return ConversationHandler.END
 
 async def admin_set_event_time(update, context):
-    new_time = update.message.text.strip()
+    new_time = parse_time(update.message.text)
+    if new_time is None:
+        await update.message.reply_text("Введите время в формате ЧЧ:ММ, например 08:30.")
+        return SET_EVENT_TIME
     event_id = context.user_data.get("admin_event_id")
-    with db_session() as session:
-        event = session.query(Event).filter_by(id=event_id).first()
-        if event:
-            event.time = new_time
-            session.commit()
-            await update.message.reply_text("Время события успешно изменено.")
-        else:
-            await update.message.reply_text("Событие не найдено.")
-    await show_main_menu(update, context)
+    tenant_id = current_tenant(context)
+    event_date = await run_query(set_event_time, tenant_id, event_id, new_time)
+    if event_date:
+        invalidate_week_schedule(tenant_id, event_date)
+        reschedule_event(event_id, new_time)
+        text = "Время события успешно изменено."
+    else:
+        text = "Событие не найдено."
+    await update.message.reply_text(text, reply_markup=main_menu_markup(update, context))
+    return ConversationHandler.END
+
+async def admin_choose_capacity_role(update, context):
+    if update.callback_query.data == "cancel":
+        return await cancel_handler(update, context)
+    _, role_id = update.callback_query.data.split("|")
+    context.user_data["admin_role_id"] = int(role_id)
+    await update.callback_query.edit_message_text(
+        "Введите число мест для роли (или «нет», чтобы снять ограничение):"
+    )
+    return SET_ROLE_CAPACITY
+
+async def admin_set_role_capacity(update, context):
+    value = update.message.text.strip().lower()
+    if value in ("нет", "-"):
+        capacity = None
+    elif value.isdigit():
+        capacity = int(value)
+    else:
+        await update.message.reply_text("Введите целое число или «нет».")
+        return SET_ROLE_CAPACITY
+    tenant_id = current_tenant(context)
+    event_date = await run_query(
+        set_role_capacity, tenant_id,
+        context.user_data.get("admin_event_id"), context.user_data.pop("admin_role_id", None), capacity,
+    )
+    if event_date:
+        invalidate_week_schedule(tenant_id, event_date)
+        text = "Число мест изменено."
+    else:
+        text = "Событие не найдено."
+    await update.message.reply_text(text, reply_markup=main_menu_markup(update, context))
     return ConversationHandler.END
 
+def parse_weekday(text):
+    """A weekday index from "1" (Monday) to "7" (Sunday)."""
+    weekday = int(text) - 1
+    if not 0 <= weekday <= 6:
+        raise ValueError(text)
+    return weekday
+
+def parse_weekdays(text):
+    """Weekday indexes from "1" to "7", or all of them for "*"."""
+    return list(WEEKDAY_RU) if text == "*" else [parse_weekday(text)]
+
+TEMPLATE_COMMANDS = (
+    "/settemplate <день 1-7> <slot> <ЧЧ:ММ> — изменить время\n"
+    "/addtemplate <день 1-7> <slot> <ЧЧ:ММ> <название> — добавить или изменить шаблон\n"
+    "/removetemplate <день 1-7> <slot> — удалить шаблон\n"
+    "/addrole <день 1-7|*> <slot> <роль> [мест] — добавить роль в шаблоны\n"
+    "/removerole <день 1-7|*> <slot> <роль> — убрать роль из шаблонов\n"
+    "/reloadtemplates — перечитать шаблоны из базы"
+)
+
+def format_templates(templates):
+    days = {}
+    for weekday, slot, time, name, roles in templates:
+        role_names = ", ".join(f"{role} ({capacity})" if capacity is not None else role for role, capacity in roles)
+        days.setdefault(weekday, []).append(f"  {slot} {time} — {name}: {role_names or 'без ролей'}")
+    text = "\n".join(f"{WEEKDAY_RU[weekday]}\n" + "\n".join(lines) for weekday, lines in days.items())
+    return (text or "Шаблонов нет.") + "\n\n" + TEMPLATE_COMMANDS
+
+async def admin_templates(update, context):
+    # /templates
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    await update.message.reply_text(format_templates(await run_db(get_templates, tenant_id)))
+
+async def admin_set_template_time(update, context):
+    # /settemplate <день недели 1-7> <slot> <HH:MM>
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    try:
+        weekday, slot, new_time = context.args
+        weekday, new_time = parse_weekday(weekday), parse_time(new_time)
+        if new_time is None:
+            raise ValueError(context.args)
+    except ValueError:
+        await update.message.reply_text("Использование: /settemplate <день недели 1-7> <morning|evening> <ЧЧ:ММ>")
+        return
+    if await run_db(set_template_time, tenant_id, weekday, slot, new_time):
+        await update.message.reply_text("Шаблон обновлён. Новые события будут создаваться с этим временем.")
+    else:
+        await update.message.reply_text("Шаблон не найден.")
+
+async def admin_add_template(update, context):
+    # /addtemplate <день недели 1-7> <slot> <HH:MM> <название>
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    try:
+        weekday, slot, new_time, *name = context.args
+        weekday, new_time = parse_weekday(weekday), parse_time(new_time)
+        if new_time is None or not name:
+            raise ValueError(context.args)
+    except ValueError:
+        await update.message.reply_text("Использование: /addtemplate <день недели 1-7> <slot> <ЧЧ:ММ> <название>")
+        return
+    if await run_db(save_template, tenant_id, weekday, slot, new_time, " ".join(name)):
+        text = "Шаблон добавлен. События по нему появятся в расписании."
+    else:
+        text = "Шаблон обновлён. Новые события будут создаваться по нему."
+    await update.message.reply_text(text)
+
+async def admin_remove_template(update, context):
+    # /removetemplate <день недели 1-7> <slot>
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    try:
+        weekday, slot = context.args
+        weekday = parse_weekday(weekday)
+    except ValueError:
+        await update.message.reply_text("Использование: /removetemplate <день недели 1-7> <slot>")
+        return
+    if await run_db(remove_template, tenant_id, weekday, slot):
+        await update.message.reply_text("Шаблон удалён. Уже созданные события остаются в расписании.")
+    else:
+        await update.message.reply_text("Шаблон не найден.")
+
+async def admin_add_template_role(update, context):
+    # /addrole <день недели 1-7|*> <slot> <роль> [мест]
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    try:
+        weekdays, slot, *role = context.args
+        weekdays = parse_weekdays(weekdays)
+        capacity = int(role.pop()) if len(role) > 1 and role[-1].isdigit() else None
+        if not role:
+            raise ValueError(context.args)
+    except ValueError:
+        await update.message.reply_text("Использование: /addrole <день недели 1-7 или *> <slot> <роль> [число мест]")
+        return
+    if await run_db(set_template_role, tenant_id, weekdays, slot, " ".join(role), capacity):
+        await update.message.reply_text("Роль добавлена в шаблоны. Она появится в новых событиях.")
+    else:
+        await update.message.reply_text("Шаблон не найден.")
+
+async def admin_remove_template_role(update, context):
+    # /removerole <день недели 1-7|*> <slot> <роль>
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    try:
+        weekdays, slot, *role = context.args
+        weekdays = parse_weekdays(weekdays)
+        if not role:
+            raise ValueError(context.args)
+    except ValueError:
+        await update.message.reply_text("Использование: /removerole <день недели 1-7 или *> <slot> <роль>")
+        return
+    if await run_db(remove_template_role, tenant_id, weekdays, slot, " ".join(role)):
+        await update.message.reply_text("Роль убрана из шаблонов. Уже созданные события не меняются.")
+    else:
+        await update.message.reply_text("Такой роли в этих шаблонах нет.")
+
+async def admin_reload_templates(update, context):
+    # /reloadtemplates, after event_templates or template_roles were edited in the database directly
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    await run_db(reload_templates, tenant_id)
+    await update.message.reply_text("Шаблоны перечитаны из базы.")
+
+def parse_export_date(text):
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(text)
+
+async def admin_export(update, context):
+    # /export <с> <по> [ics|csv]
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    try:
+        start, end, *rest = context.args
+        start, end = parse_export_date(start), parse_export_date(end)
+        formats = [fmt.lower() for fmt in rest] or list(EXPORT_FORMATS)
+        if start > end or len(rest) > 1 or formats[0] not in EXPORT_FORMATS:
+            raise ValueError(context.args)
+    except ValueError:
+        await update.message.reply_text(
+            "Использование: /export <с> <по> [ics|csv], даты в виде 2024-05-01 или 01.05.2024"
+        )
+        return
+    for fmt in formats:
+        buffer = await run_db(export_schedule, tenant_id, start, end, fmt)
+        try:
+            await update.message.reply_document(buffer, filename=f"schedule_{start}_{end}.{fmt}")
+        finally:
+            buffer.close()
+
+async def admin_stats(update, context):
+    # /stats [месяцев]
+    tenant_id = current_tenant(context)
+    if not is_admin(tenant_id, update.effective_user.id):
+        return
+    try:
+        months = int(context.args[0]) if context.args else ATTENDANCE_REPORT_MONTHS
+        if len(context.args) > 1 or not 1 <= months <= 120:
+            raise ValueError(context.args)
+    except ValueError:
+        await update.message.reply_text("Использование: /stats [число месяцев]")
+        return
+    text = await run_db(attendance_report, tenant_id, datetime.today().date(), months)
+    await update.message.reply_text(text)
+
 admin_conv = ConversationHandler(
     entry_points=[MessageHandler(filters.Regex("^Редактировать события$"), admin)],
     states={
@@ -85,9 +318,16 @@ admin_conv = ConversationHandler(
             CallbackQueryHandler(cancel_handler, pattern="^cancel$")
         ],
         EDIT_EVENT_CHOICE: [
-            CallbackQueryHandler(admin_edit_event_choice, pattern=r"^(edittime|cancel)$")
+            CallbackQueryHandler(admin_edit_event_choice, pattern=r"^(edittime|editcapacity|cancel)$")
+        ],
+        SET_EVENT_TIME: [MessageHandler(ANSWER, admin_set_event_time)],
+        CHOOSE_CAPACITY_ROLE: [
+            CallbackQueryHandler(admin_choose_capacity_role, pattern=r"^capacityrole\|"),
+            CallbackQueryHandler(cancel_handler, pattern="^cancel$")
         ],
-        SET_EVENT_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_set_event_time)],
+        SET_ROLE_CAPACITY: [MessageHandler(ANSWER, admin_set_role_capacity)],
     },
     fallbacks=[MessageHandler(filters.Regex("^Отмена$"), cancel_handler)],
+    name="admin",
+    persistent=True,
 )
\ No newline at end of file
@@ -3,45 +3,41 @@ from telegram.ext import (
     ConversationHandler, CallbackQueryHandler, MessageHandler, filters
 )
 from shared.cancel import cancel_handler
-from shared.main_menu import show_main_menu
+from shared.main_menu import show_main_menu, main_menu_markup
 from shared.notifications import notify_admins
-from db.context import db_session
-from db_setup import Participation, Event
+from shared.reminders import cancel_reminder
+from service.schedule_service import invalidate_week_schedule
+from service.tenants import current_tenant
+from db.context import run_query
+from db.queries import (
+    get_upcoming_participations, delete_participation, delete_upcoming_participations
+)
 from utils.formatting import ru_date_string
 from datetime import datetime
-from sqlalchemy.orm import joinedload
 
 CHOOSING_CANCEL = 100
 
 async def show_cancel_participation_menu(update, context):
     username = update.effective_user.username
     if not username:
-        await update.message.reply_text("У вас должен быть установлен username в Telegram для отмены участия.")
-        await show_main_menu(update, context)
+        await update.message.reply_text(
+            "У вас должен быть установлен username в Telegram для отмены участия.",
+            reply_markup=main_menu_markup(update, context)
+        )
         return ConversationHandler.END
     today = datetime.today().date()
-    with db_session() as session:
-        parts = (
-            session.query(Participation)
-            .options(joinedload(Participation.event), joinedload(Participation.role))
-            .join(Event)
-            .filter(
-                Participation.username == username,
-                Event.date >= today
-            )
-            .order_by(Event.date, Event.slot)
-            .all()
-        )
+    parts = await run_query(get_upcoming_participations, current_tenant(context), username, today)
     if not parts:
-        await update.message.reply_text("У вас нет активных записей для отмены.")
-        await show_main_menu(update, context)
+        await update.message.reply_text(
+            "У вас нет активных записей для отмены.",
+            reply_markup=main_menu_markup(update, context)
+        )
         return ConversationHandler.END
     keyboard = []
     for p in parts:
-        event = p.event
         role = p.role.name if p.role else "Без роли"
         btn_text = (
-            f"{ru_date_string(event.date)}, {event.time} — {role}"
+            f"{ru_date_string(p.date)}, {p.time} — {role}"
         )
         keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"cancelpart|{p.id}")])
     keyboard.append([InlineKeyboardButton("❌ Отменить все", callback_data="cancelall")])
@@ -56,53 +52,40 @@ async def cancel_participation(update, context):
     if update.callback_query.data == "cancel":
         return await cancel_handler(update, context)
     username = update.effective_user.username
+    tenant_id = current_tenant(context)
     today = datetime.today().date()
     if update.callback_query.data == "cancelall":
         notify_msgs = []
-        with db_session() as session:
-            canceled_parts = (
-                session.query(Participation)
-                .join(Event)
-                .filter(
-                    Participation.username == username,
-                    Event.date >= today
-                )
-                .all()
+        canceled_parts = await run_query(delete_upcoming_participations, tenant_id, username, today)
+        for day in {p.date for p in canceled_parts}:
+            invalidate_week_schedule(tenant_id, day)
+        for p in canceled_parts:
+            cancel_reminder(p.event_id, p.role.id if p.role else None, p.username)
+            role = p.role.name if p.role else "Без роли"
+            notify_msgs.append(
+                f"🔴 @{username} отменил участие в событии:\n"
+                f"{ru_date_string(p.date)}, {p.time}\n"
+                f"Роль: {role}"
             )
-            for p in canceled_parts:
-                event = p.event
-                role = p.role.name if p.role else "Без роли"
-                notify_msgs.append(
-                    f"🔴 @{username} отменил участие в событии:\n"
-                    f"{ru_date_string(event.date)}, {event.time}\n"
-                    f"Роль: {role}"
-                )
-            for p in canceled_parts:
-                session.delete(p)
-            session.commit()
-        # Optionally, notify admins (implement if needed)
-        for msg in notify_msgs:
-            await notify_admins(context, msg)
+        await notify_admins(context, tenant_id, *notify_msgs)
         await update.callback_query.edit_message_text("Все ваши участия отменены.")
         await show_main_menu(update, context)
         return ConversationHandler.END
     else:
         _, part_id = update.callback_query.data.split("|")
-        with db_session() as session:
-            part = session.query(Participation).filter_by(id=int(part_id)).first()
-            if not part:
-                await update.callback_query.answer("Запись не найдена.")
-                await show_main_menu(update, context)
-                return ConversationHandler.END
-            event = part.event
-            role = part.role.name if part.role else "Без роли"
-            text = (f"🔴 @{username} отменил участие в событии:\n"
-                    f"{ru_date_string(event.date)}, {event.time}\n"
-                    f"Роль: {role}")
-            session.delete(part)
-            session.commit()
+        part = await run_query(delete_participation, tenant_id, int(part_id), username)
+        if not part:
+            await update.callback_query.answer("Запись не найдена.")
+            await show_main_menu(update, context)
+            return ConversationHandler.END
+        invalidate_week_schedule(tenant_id, part.date)
+        cancel_reminder(part.event_id, part.role.id if part.role else None, part.username)
+        role = part.role.name if part.role else "Без роли"
+        text = (f"🔴 @{username} отменил участие в событии:\n"
+                f"{ru_date_string(part.date)}, {part.time}\n"
+                f"Роль: {role}")
         # Optionally, notify admins (implement if needed)
-        await notify_admins(context, text)
+        await notify_admins(context, tenant_id, text)
         await update.callback_query.edit_message_text("Ваше участие отменено.")
         await show_main_menu(update, context)
         return ConversationHandler.END
@@ -116,4 +99,6 @@ cancel_conv = ConversationHandler(
         ],
     },
     fallbacks=[MessageHandler(filters.Regex("^Отмена$"), cancel_handler)],
+    name="cancel",
+    persistent=True,
 )
\ No newline at end of file
@@ -0,0 +1,81 @@
+import os
+import re
+from datetime import datetime, date, timedelta
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import InlineQueryHandler
+from db.context import run_db
+from service.tenants import current_tenant, tenant_count
+from service.schedule_service import (
+    ensure_week_events, get_day_cards, get_week_schedule_text, page_count, page_of
+)
+from utils.formatting import MAX_MESSAGE_LENGTH, ru_date_string
+
+# Seconds Telegram may reuse an answer without asking the bot again.
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "60"))
+WEEK_QUERIES = ("", "week", "неделя")
+DAY_QUERIES = {"today": 0, "сегодня": 0, "tomorrow": 1, "завтра": 1}
+
+def parse_day(query: str):
+    """A date from "2024-05-20", "20.05", "20.05.2024", "сегодня" or "завтра"; None otherwise."""
+    today = datetime.today().date()
+    if query in DAY_QUERIES:
+        return today + timedelta(days=DAY_QUERIES[query])
+    try:
+        return date.fromisoformat(query)
+    except ValueError:
+        pass
+    match = re.fullmatch(r"(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?", query)
+    if not match:
+        return None
+    day, month, year = match.groups()
+    try:
+        parsed = date(int(year or today.year), int(month), int(day))
+    except ValueError:
+        return None
+    if not year and parsed < today:  # "05.01" asked in December means next year
+        try:
+            parsed = parsed.replace(year=today.year + 1)
+        except ValueError:
+            return None
+    return parsed
+
+def card_article(day, summary, text):
+    return InlineQueryResultArticle(
+        id=f"day|{day}",
+        title=ru_date_string(day),
+        description=summary,
+        # Telegram rejects the whole answer if any message is too long.
+        input_message_content=InputTextMessageContent(
+            text if len(text) <= MAX_MESSAGE_LENGTH else text[:MAX_MESSAGE_LENGTH - 1] + "…"
+        ),
+    )
+
+async def inline_schedule(update, context):
+    query = update.inline_query.query.strip().lower()
+    tenant_id = current_tenant(context)
+    results = []
+    if query in WEEK_QUERIES:
+        await run_db(ensure_week_events, tenant_id)
+        cards = await run_db(get_day_cards, tenant_id)
+        week_text = await run_db(get_week_schedule_text, tenant_id) if cards else ""
+        # A week too long for one message is left out; the day cards below carry it.
+        if cards and len(week_text) <= MAX_MESSAGE_LENGTH:
+            results.append(InlineQueryResultArticle(
+                id="week",
+                title="Расписание на неделю",
+                description=f"{ru_date_string(cards[0][0])} — {ru_date_string(cards[-1][0])}",
+                input_message_content=InputTextMessageContent(week_text),
+            ))
+        results.extend(card_article(*card) for card in cards)
+    else:
+        day = parse_day(query)
+        if day is not None and 0 <= page_of(day) < page_count():
+            await run_db(ensure_week_events, tenant_id, page_of(day))
+            cards = await run_db(get_day_cards, tenant_id, page_of(day))
+            results.extend(card_article(*card) for card in cards if card[0] == day.isoformat())
+    # Answers depend on the user's group; with several groups Telegram must not share them between users.
+    await update.inline_query.answer(
+        results, cache_time=INLINE_CACHE_TIME, is_personal=tenant_count() > 1
+    )
+
+inline_handler = InlineQueryHandler(inline_schedule)
@@ -3,36 +3,72 @@ from telegram.ext import (
     ConversationHandler, CallbackQueryHandler, MessageHandler, filters
 )
 from shared.cancel import cancel_handler
-from shared.main_menu import show_main_menu
+from shared.main_menu import show_main_menu, main_menu_markup
 from shared.notifications import notify_admins
-from service.schedule_service import ensure_week_events, get_week_schedule, week_dates
-from utils.formatting import build_schedule_text, ru_date_string, get_slot_label
-from db.context import db_session
-from db.queries import get_event_by_id
-from db_setup import Participation
+from shared.reminders import schedule_reminder
+from service.tenants import current_tenant
+from service.schedule_service import (
+    ensure_week_events, get_day_events, get_event, get_week_view, get_week_schedule_text,
+    invalidate_week_schedule, page_count
+)
+from utils.formatting import ru_date_string, get_role_label, get_slot_label
+from db.context import run_db, run_query
+from db.queries import ALREADY_SIGNED_UP, ROLE_FULL, add_participation
 
 CHOOSING_DAY, CHOOSING_EVENT, CHOOSING_ROLE = range(3)
 
+def page_buttons(prefix, page):
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀ Назад", callback_data=f"{prefix}|{page - 1}"))
+    if page + 1 < page_count():
+        buttons.append(InlineKeyboardButton("Далее ▶", callback_data=f"{prefix}|{page + 1}"))
+    return buttons
+
 async def schedule_handler(update, context):
-    ensure_week_events()
-    event_dtos = get_week_schedule()
-    text = build_schedule_text(event_dtos, markdown=False)
-    await update.message.reply_text(text)
-    await show_main_menu(update, context)
+    tenant_id = current_tenant(context)
+    await run_db(ensure_week_events, tenant_id)
+    text = await run_db(get_week_schedule_text, tenant_id)
+    nav = page_buttons("schedpage", 0)
+    if nav:
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup([nav]))
+        await show_main_menu(update, context)
+    else:
+        await update.message.reply_text(text, reply_markup=main_menu_markup(update, context))
 
-async def participate_handler(update, context):
-    ensure_week_events()
-    event_dtos = get_week_schedule()
-    schedule = {e.date: {} for e in event_dtos}
-    for event in event_dtos:
-        schedule[event.date][event.slot] = event
-    keyboard = []
-    for date in week_dates():
-        events_today = [schedule.get(date.isoformat(), {}).get(slot) for slot in ["morning", "evening"] if schedule.get(date.isoformat(), {}).get(slot)]
-        if events_today:
-            date_str = ru_date_string(date.isoformat())
-            keyboard.append([InlineKeyboardButton(date_str, callback_data=f"chooseday|{date.isoformat()}")])
+async def schedule_page_handler(update, context):
+    _, page = update.callback_query.data.split("|")
+    page = int(page)
+    tenant_id = current_tenant(context)
+    await run_db(ensure_week_events, tenant_id, page)
+    text = await run_db(get_week_schedule_text, tenant_id, page)
+    await update.callback_query.answer()
+    await update.callback_query.edit_message_text(
+        text, reply_markup=InlineKeyboardMarkup([page_buttons("schedpage", page)])
+    )
+
+async def load_day_keyboard(tenant_id, page):
+    await run_db(ensure_week_events, tenant_id, page)
+    view = await run_db(get_week_view, tenant_id, page)
+    keyboard = [
+        [InlineKeyboardButton(ru_date_string(date), callback_data=f"chooseday|{date}")]
+        for date in view.dates
+        if view.day(date)
+    ]
+    nav = page_buttons("daypage", page)
+    if nav:
+        keyboard.append(nav)
     keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel")])
+    return keyboard
+
+def forget_choice(context):
+    # Only ids and dates are kept between steps; events are re-read from the week cache.
+    context.user_data.pop("chosen_date", None)
+    context.user_data.pop("chosen_event_id", None)
+
+async def participate_handler(update, context):
+    forget_choice(context)
+    keyboard = await load_day_keyboard(current_tenant(context), 0)
     if len(keyboard) == 1:  # Only cancel button present
         await update.message.reply_text(
             "Нет событий на этой неделе. Пожалуйста, попробуйте позже или обратитесь к администратору.",
@@ -40,26 +76,29 @@ async def participate_handler(update, context):
         )
         await show_main_menu(update, context)
         return ConversationHandler.END
-    context.user_data["schedule"] = schedule
     await update.message.reply_text(
         "Выберите день для участия:",
         reply_markup=InlineKeyboardMarkup(keyboard),
     )
     return CHOOSING_DAY
 
+async def choose_day_page(update, context):
+    _, page = update.callback_query.data.split("|")
+    keyboard = await load_day_keyboard(current_tenant(context), int(page))
+    await update.callback_query.answer()
+    await update.callback_query.edit_message_reply_markup(InlineKeyboardMarkup(keyboard))
+    return CHOOSING_DAY
+
 async def choose_day(update, context):
     if update.callback_query.data == "cancel":
         return await cancel_handler(update, context)
     _, day_iso = update.callback_query.data.split("|")
     chosen_date = day_iso
     context.user_data["chosen_date"] = chosen_date
-    schedule = context.user_data["schedule"]
     keyboard = []
-    for slot in ["morning", "evening"]:
-        event = schedule.get(chosen_date, {}).get(slot)
-        if event:
-            btn_text = get_slot_label(slot, event.time)  # e.g. "Утро (08:00)"
-            keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"chooseevent|{event.id}")])
+    for event in await run_db(get_day_events, current_tenant(context), chosen_date):
+        btn_text = get_slot_label(event.slot, event.time)  # e.g. "Утро (08:00)"
+        keyboard.append([InlineKeyboardButton(btn_text, callback_data=f"chooseevent|{event.id}")])
     keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel")])
     if len(keyboard) == 1:
         await update.callback_query.edit_message_text("Нет событий на этот день.", reply_markup=InlineKeyboardMarkup(keyboard))
@@ -75,9 +114,9 @@ async def choose_event(update, context):
     if update.callback_query.data == "cancel":
         return await cancel_handler(update, context)
     _, event_id = update.callback_query.data.split("|")
-    context.user_data["chosen_event_id"] = int(event_id)
-    with db_session() as session:
-        event = get_event_by_id(session, int(event_id))
+    event = await run_db(
+        get_event, current_tenant(context), int(event_id), context.user_data.get("chosen_date")
+    )
     if not event:
         await update.callback_query.answer("Событие не найдено.")
         await show_main_menu(update, context)
@@ -87,8 +126,9 @@ async def choose_event(update, context):
         await update.callback_query.answer("В этом событии нет ролей.")
         await show_main_menu(update, context)
         return ConversationHandler.END
+    context.user_data["chosen_event_id"] = event.id
     keyboard = [
-        [InlineKeyboardButton(role.name, callback_data=f"chooserole|{role.id}")]
+        [InlineKeyboardButton(get_role_label(event, role), callback_data=f"chooserole|{role.id}")]
         for role in roles
     ]
     keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel")])
@@ -108,31 +148,37 @@ async def choose_role(update, context):
         )
         await show_main_menu(update, context)
         return ConversationHandler.END
-    event_id = context.user_data["chosen_event_id"]
-    with db_session() as session:
-        already = (
-            session.query(Participation)
-            .filter_by(event_id=event_id, role_id=int(role_id), username=username)
-            .first()
+    tenant_id = current_tenant(context)
+    event = await run_db(
+        get_event, tenant_id, context.user_data["chosen_event_id"], context.user_data.get("chosen_date")
+    )
+    forget_choice(context)
+    if not event:
+        await update.callback_query.edit_message_text("Событие не найдено.")
+        await show_main_menu(update, context)
+        return ConversationHandler.END
+    chat_id = update.effective_chat.id
+    result = await run_query(add_participation, event.id, int(role_id), username, chat_id)
+    if result == ALREADY_SIGNED_UP:
+        await update.callback_query.edit_message_text(
+            "Вы уже записаны на эту роль в этом событии."
         )
-        if already:
-            await update.callback_query.edit_message_text(
-                "Вы уже записаны на эту роль в этом событии."
-            )
-            await show_main_menu(update, context)
-            return ConversationHandler.END
-        participation = Participation(
-            username=username, event_id=event_id, role_id=int(role_id)
+        await show_main_menu(update, context)
+        return ConversationHandler.END
+    # Signed up or full, the cached seat counts for this event are out of date.
+    invalidate_week_schedule(tenant_id, event.date)
+    if result == ROLE_FULL:
+        await update.callback_query.edit_message_text(
+            "На эту роль больше нет свободных мест. Выберите другую роль или событие."
         )
-        session.add(participation)
-        session.commit()
-        from db.queries import get_event_by_id as get_event_dto_by_id
-        event = get_event_dto_by_id(session, event_id)
-        role = next((r for r in event.roles if r.id == int(role_id)), None)
+        await show_main_menu(update, context)
+        return ConversationHandler.END
+    role = next((r for r in event.roles if r.id == int(role_id)), None)
+    schedule_reminder(event, int(role_id), role.name if role else None, username, chat_id)
     text = (f"🟢 @{username} записался на событие:\n"
             f"{ru_date_string(event.date)}, {event.time}\n"
             f"Роль: {role.name if role else 'Без роли'}")
-    await notify_admins(context, text)
+    await notify_admins(context, tenant_id, text)
     await update.callback_query.edit_message_text(
         "Вы записаны на событие. Спасибо!\n\nТекущее расписание на эту неделю:"
     )
@@ -146,6 +192,7 @@ participate_conv = ConversationHandler(
     states={
         CHOOSING_DAY: [
             CallbackQueryHandler(choose_day, pattern=r"^chooseday"),
+            CallbackQueryHandler(choose_day_page, pattern=r"^daypage\|"),
             CallbackQueryHandler(cancel_handler, pattern="^cancel$")
         ],
         CHOOSING_EVENT: [
@@ -158,4 +205,6 @@ participate_conv = ConversationHandler(
         ],
     },
     fallbacks=[MessageHandler(filters.Regex("^Отмена$"), cancel_handler)],
+    name="participate",
+    persistent=True,
 )
\ No newline at end of file
@@ -0,0 +1,54 @@
+import os
+from datetime import date
+from db.context import db_session
+from db.attendance import LATE_CANCEL_HOURS, get_role_coverage, get_user_stats
+from utils.formatting import MAX_MESSAGE_LENGTH, MONTH_RU, WEEKDAY_RU
+
+# Months /stats covers when no count is given.
+ATTENDANCE_REPORT_MONTHS = int(os.getenv("ATTENDANCE_REPORT_MONTHS", "3"))
+# Users listed in /stats, busiest first.
+ATTENDANCE_REPORT_USERS = int(os.getenv("ATTENDANCE_REPORT_USERS", "30"))
+
+def report_start(today: date, months: int) -> date:
+    """First day of the month ``months - 1`` months before ``today``'s."""
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+def attendance_report(tenant_id: int, today: date, months: int = ATTENDANCE_REPORT_MONTHS) -> str:
+    """The /stats text, read from the attendance aggregates only."""
+    since = report_start(today, months)
+    with db_session() as session:
+        user_rows = get_user_stats(session, tenant_id, since)
+        role_rows = get_role_coverage(session, tenant_id, since)
+    lines = [f"Статистика с {since.day} {MONTH_RU[since.month]} {since.year}"]
+
+    users = {}
+    for username, month, served, late in user_rows:
+        users.setdefault(username, []).append((month, served, late))
+    busiest = sorted(users.items(), key=lambda item: (-sum(served for _, served, _ in item[1]), item[0]))
+    lines.append("")
+    lines.append(f"Служения по месяцам (в скобках отмены менее чем за {LATE_CANCEL_HOURS:g} ч до начала):")
+    for username, months_served in busiest[:ATTENDANCE_REPORT_USERS]:
+        cells = [
+            f"{MONTH_RU[month.month]} {served}" + (f" ({late})" if late else "")
+            for month, served, late in months_served
+        ]
+        lines.append(f"@{username}: " + ", ".join(cells))
+    if len(busiest) > ATTENDANCE_REPORT_USERS:
+        lines.append(f"… и ещё {len(busiest) - ATTENDANCE_REPORT_USERS}")
+    if not busiest:
+        lines.append("Записей нет.")
+
+    lines.append("")
+    lines.append("Роли без участников (событий без записи из всех):")
+    gaps = {}
+    for weekday, role_name, events, covered, _ in role_rows:
+        if events and covered < events:
+            gaps.setdefault(weekday, []).append(f"{role_name} {events - covered} из {events}")
+    for weekday in sorted(gaps):
+        lines.append(f"{WEEKDAY_RU[weekday]}: " + ", ".join(gaps[weekday]))
+    if not gaps:
+        lines.append("Все роли заняты.")
+
+    text = "\n".join(lines)
+    return text if len(text) <= MAX_MESSAGE_LENGTH else text[:MAX_MESSAGE_LENGTH - 1] + "…"
@@ -0,0 +1,81 @@
+import os
+import csv
+import codecs
+import tempfile
+from datetime import datetime, timezone
+from itertools import groupby
+from db.context import db_session
+from db.queries import iter_export_rows
+from utils.times import parse_time
+
+# Rows fetched from the database per round trip while exporting.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+# Exports larger than this spill from memory to a temporary file before upload.
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(1024 * 1024)))
+EXPORT_FORMATS = ("ics", "csv")
+CSV_HEADER = ["date", "time", "slot", "event", "role", "username"]
+
+def write_csv(rows, out):
+    out.write("\ufeff")  # byte order mark, so spreadsheet apps detect UTF-8
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    for _, event_date, time, slot, name, role, username in rows:
+        writer.writerow([event_date.isoformat(), time, slot, name, role or "", username or ""])
+
+def _ics_text(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+def _ics_line(out, line: str):
+    # Content lines are folded at 75 octets, continuation lines start with a space.
+    data, limit = line.encode("utf-8"), 75
+    while len(data) > limit:
+        cut = limit
+        while data[cut] & 0xC0 == 0x80:  # do not split a UTF-8 sequence
+            cut -= 1
+        out.write(data[:cut].decode("utf-8") + "\r\n ")
+        data, limit = data[cut:], 74
+    out.write(data.decode("utf-8") + "\r\n")
+
+def write_ics(rows, out):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    _ics_line(out, "BEGIN:VCALENDAR")
+    _ics_line(out, "VERSION:2.0")
+    _ics_line(out, "PRODID:-//schedule-bot//export//RU")
+    # Rows arrive grouped by event, so only one event's signups are held at a time.
+    for (event_id, event_date, time, _, name), group in groupby(rows, key=lambda row: row[:5]):
+        signups = [
+            f"@{username}: {role or 'Без роли'}" for *_, role, username in group if username
+        ]
+        start = parse_time(time)
+        _ics_line(out, "BEGIN:VEVENT")
+        _ics_line(out, f"UID:event-{event_id}@schedule-bot")
+        _ics_line(out, f"DTSTAMP:{stamp}")
+        if start:
+            _ics_line(out, f"DTSTART:{event_date:%Y%m%d}T{start.replace(':', '')}00")
+        else:
+            _ics_line(out, f"DTSTART;VALUE=DATE:{event_date:%Y%m%d}")
+        _ics_line(out, f"SUMMARY:{_ics_text(name)}")
+        if signups:
+            _ics_line(out, f"DESCRIPTION:{_ics_text(chr(10).join(signups))}")
+        _ics_line(out, "END:VEVENT")
+    _ics_line(out, "END:VCALENDAR")
+
+WRITERS = {"ics": write_ics, "csv": write_csv}
+
+def export_schedule(tenant_id: int, start, end, fmt: str):
+    """Write the tenant's events and signups from ``start`` to ``end`` as ``fmt`` into a file ready to upload.
+
+    Rows are streamed from the database straight into the file, which stays in
+    memory up to EXPORT_SPOOL_BYTES and spills to disk beyond that. The caller
+    closes it.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    # Encode into the spooled file directly: wrapping it in io.TextIOWrapper
+    # needs Python 3.11, where SpooledTemporaryFile became a full IOBase.
+    out = codecs.getwriter("utf-8")(buffer)
+    with db_session() as session:
+        WRITERS[fmt](iter_export_rows(session, tenant_id, start, end, EXPORT_CHUNK_ROWS), out)
+    buffer.seek(0)
+    return buffer
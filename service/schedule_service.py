@@ -1,16 +1,24 @@
+import os
+import math
+import threading
+from collections import namedtuple
 from datetime import datetime, timedelta
 from typing import List
 from db.queries import (
-    get_events_for_dates, get_or_create_role
+    get_events_for_dates, get_event_by_id, get_or_create_roles
 )
-from db.dto import EventDTO
+from db.dto import EventDTO, WeekView
 from db.context import db_session
-from db_setup import Event
+from db.attendance import record_new_event_roles
+from db_setup import Event, EventTemplate, Role, event_roles, template_roles
+from sqlalchemy import insert, select
+from utils.lru import LRUCache
 
 WEEKDAY_RU = {
     0: "Понедельник", 1: "Вторник", 2: "Среда", 3: "Четверг",
     4: "Пятница", 5: "Суббота", 6: "Воскресенье",
 }
+# Defaults seeded into event_templates for a new database or tenant.
 DEFAULT_EVENT_TIMES = {
     "Понедельник":    {"morning": "08:00", "evening": "19:30"},
     "Вторник":        {"morning": "08:00", "evening": "19:30"},
@@ -22,31 +30,379 @@ DEFAULT_EVENT_TIMES = {
 }
 DEFAULT_EVENT_NAMES = {"morning": "Утреннее служение", "evening": "Вечернее служение"}
 DEFAULT_ROLES = ["Ведущий молитвы", "Хор", "Ритм"]
+# Seats per event for the default roles of a new database or tenant; roles not
+# listed are unlimited.
+DEFAULT_ROLE_CAPACITY = {"Ведущий молитвы": 1, "Хор": 12, "Ритм": 2}
+# How far ahead signups are open; schedules are shown in pages of PAGE_DAYS.
+SCHEDULE_HORIZON_DAYS = int(os.getenv("SCHEDULE_HORIZON_DAYS", "7"))
+PAGE_DAYS = 7
+# Upper bounds on in-memory state: schedule pages over all tenants, and
+# tenants whose compiled templates are kept.
+SCHEDULE_CACHE_PAGES = int(os.getenv("SCHEDULE_CACHE_PAGES", "512"))
+TEMPLATE_CACHE_TENANTS = int(os.getenv("TEMPLATE_CACHE_TENANTS", "256"))
 
-def week_dates() -> List[datetime.date]:
+def page_count() -> int:
+    return max(1, math.ceil(SCHEDULE_HORIZON_DAYS / PAGE_DAYS))
+
+def week_dates(page: int = 0) -> List[datetime.date]:
     today = datetime.today().date()
-    return [(today + timedelta(days=i)) for i in range(7)]
-
-def ensure_week_events():
-    with db_session() as session:
-        dates = week_dates()
-        existing = set((e.date, e.slot) for e in session.query(Event).filter(Event.date.in_(dates)).all())
-        for date in dates:
-            weekday = WEEKDAY_RU[date.weekday()]
-            for slot in ["morning", "evening"]:
-                if (date, slot) not in existing:
-                    event = Event(
-                        date=date,
-                        slot=slot,
-                        name=DEFAULT_EVENT_NAMES[slot],
-                        time=DEFAULT_EVENT_TIMES[weekday][slot]
-                    )
-                    for role_name in DEFAULT_ROLES:
-                        role = get_or_create_role(session, role_name)
-                        event.roles.append(role)
-                    session.add(event)
+    start = max(0, min(page, page_count() - 1)) * PAGE_DAYS
+    end = min(start + PAGE_DAYS, SCHEDULE_HORIZON_DAYS)
+    return [(today + timedelta(days=i)) for i in range(start, end)]
+
+# Weekday -> [CompiledTemplate], ordered by time. Built from event_templates
+# on first use and rebuilt by reload_templates() after an edit.
+# Roles are (role_id, capacity) pairs.
+CompiledTemplate = namedtuple("CompiledTemplate", ["slot", "name", "time", "roles"])
+
+class _TenantState:
+    """A tenant's compiled templates and the dates whose slots are known to exist.
+
+    Pages are materialized lazily, so the dates need not be contiguous.
+    """
+    __slots__ = ("templates", "materialized", "lock")
+
+    def __init__(self):
+        self.templates = None
+        self.materialized = set()
+        self.lock = threading.Lock()
+
+# Evicted tenants simply recompile and re-check their dates on next use.
+_tenant_states = LRUCache(TEMPLATE_CACHE_TENANTS)
+_states_lock = threading.Lock()
+
+def _tenant_state(tenant_id) -> _TenantState:
+    with _states_lock:
+        state = _tenant_states.get(tenant_id)
+        if state is None:
+            state = _tenant_states[tenant_id] = _TenantState()
+        return state
+
+def seed_default_templates(tenant_id: int, capacities: bool = True):
+    """Give a tenant without templates the default week; without ``capacities`` its roles are unlimited.
+
+    Called once, when the database or the tenant is created, so a tenant whose
+    admins removed every template keeps none.
+    """
+    with db_session() as session:
+        if session.query(EventTemplate.id).filter(EventTemplate.tenant_id == tenant_id).first():
+            return
+        _seed_default_templates(session, tenant_id, DEFAULT_ROLE_CAPACITY if capacities else {})
+
+def _seed_default_templates(session, tenant_id, capacities):
+    roles = get_or_create_roles(session, tenant_id, DEFAULT_ROLES)
+    templates = [
+        EventTemplate(
+            tenant_id=tenant_id,
+            weekday=weekday,
+            slot=slot,
+            name=DEFAULT_EVENT_NAMES[slot],
+            time=DEFAULT_EVENT_TIMES[weekday_name][slot],
+        )
+        for weekday, weekday_name in WEEKDAY_RU.items()
+        for slot in ["morning", "evening"]
+    ]
+    session.add_all(templates)
+    session.flush()
+    session.execute(template_roles.insert(), [
+        {"template_id": template.id, "role_id": role.id, "capacity": capacities.get(role.name)}
+        for template in templates
+        for role in roles
+    ])
+    session.commit()
+
+def _compile_templates(session, tenant_id):
+    templates = session.query(EventTemplate).filter(EventTemplate.tenant_id == tenant_id)
+    roles = {}
+    for template_id, role_id, capacity in session.execute(
+        select(template_roles.c.template_id, template_roles.c.role_id, template_roles.c.capacity)
+        .join(EventTemplate, EventTemplate.id == template_roles.c.template_id)
+        .where(EventTemplate.tenant_id == tenant_id)
+        .order_by(template_roles.c.role_id)
+    ):
+        roles.setdefault(template_id, []).append((role_id, capacity))
+    compiled = {weekday: [] for weekday in WEEKDAY_RU}
+    for t in templates.order_by(EventTemplate.weekday, EventTemplate.time):
+        compiled[t.weekday].append(CompiledTemplate(t.slot, t.name, t.time, tuple(roles.get(t.id, ()))))
+    return compiled
+
+def reload_templates(tenant_id: int):
+    """Recompile a tenant's templates after an edit; dates are re-checked on next view."""
+    state = _tenant_state(tenant_id)
+    with state.lock:
+        with db_session() as session:
+            state.templates = _compile_templates(session, tenant_id)
+        state.materialized.clear()
+
+def set_template_time(tenant_id: int, weekday: int, slot: str, new_time: str) -> bool:
+    with db_session() as session:
+        template = (
+            session.query(EventTemplate)
+            .filter_by(tenant_id=tenant_id, weekday=weekday, slot=slot)
+            .first()
+        )
+        if not template:
+            return False
+        template.time = new_time
+        session.commit()
+    reload_templates(tenant_id)
+    return True
+
+def get_templates(tenant_id: int):
+    """The tenant's templates by weekday and time, as (weekday, slot, time, name, [(role name, capacity)])."""
+    with db_session() as session:
+        roles = {}
+        for template_id, role_name, capacity in session.execute(
+            select(template_roles.c.template_id, Role.name, template_roles.c.capacity)
+            .join(Role, Role.id == template_roles.c.role_id)
+            .join(EventTemplate, EventTemplate.id == template_roles.c.template_id)
+            .where(EventTemplate.tenant_id == tenant_id)
+            .order_by(Role.id)
+        ):
+            roles.setdefault(template_id, []).append((role_name, capacity))
+        return [
+            (t.weekday, t.slot, t.time, t.name, roles.get(t.id, []))
+            for t in session.query(EventTemplate)
+            .filter(EventTemplate.tenant_id == tenant_id)
+            .order_by(EventTemplate.weekday, EventTemplate.time)
+        ]
+
+def save_template(tenant_id: int, weekday: int, slot: str, time: str, name: str) -> bool:
+    """Create the template for ``weekday`` and ``slot``, or update its time and name.
+
+    A new template gets the roles of the tenant's other templates in the same
+    slot, or of any template if the slot is new. Returns whether it was created.
+    """
+    with db_session() as session:
+        template = (
+            session.query(EventTemplate)
+            .filter_by(tenant_id=tenant_id, weekday=weekday, slot=slot)
+            .first()
+        )
+        created = template is None
+        if created:
+            source = (
+                session.query(EventTemplate.id)
+                .filter(EventTemplate.tenant_id == tenant_id)
+                .order_by((EventTemplate.slot != slot), EventTemplate.weekday)
+                .first()
+            )
+            template = EventTemplate(tenant_id=tenant_id, weekday=weekday, slot=slot)
+            session.add(template)
+        template.time, template.name = time, name
+        session.flush()
+        if created and source:
+            session.execute(template_roles.insert(), [
+                {"template_id": template.id, "role_id": role_id, "capacity": capacity}
+                for role_id, capacity in session.execute(
+                    select(template_roles.c.role_id, template_roles.c.capacity)
+                    .where(template_roles.c.template_id == source.id)
+                )
+            ])
+        session.commit()
+    reload_templates(tenant_id)
+    return created
+
+def remove_template(tenant_id: int, weekday: int, slot: str) -> bool:
+    """Delete a template; events already created from it are kept."""
+    with db_session() as session:
+        template = (
+            session.query(EventTemplate)
+            .filter_by(tenant_id=tenant_id, weekday=weekday, slot=slot)
+            .first()
+        )
+        if not template:
+            return False
+        session.execute(template_roles.delete().where(template_roles.c.template_id == template.id))
+        session.delete(template)
         session.commit()
+    reload_templates(tenant_id)
+    return True
 
-def get_week_schedule() -> List[EventDTO]:
+def _template_ids(session, tenant_id, weekdays, slot):
+    return session.execute(
+        select(EventTemplate.id).where(
+            EventTemplate.tenant_id == tenant_id, EventTemplate.weekday.in_(weekdays), EventTemplate.slot == slot
+        )
+    ).scalars().all()
+
+def set_template_role(tenant_id: int, weekdays: List[int], slot: str, role_name: str, capacity) -> int:
+    """Offer ``role_name`` with ``capacity`` seats (None: unlimited) in the slot's templates on ``weekdays``.
+
+    The role is created if the tenant has none by that name. Returns the number of templates changed.
+    """
+    with db_session() as session:
+        ids = _template_ids(session, tenant_id, weekdays, slot)
+        if not ids:
+            return 0
+        role = get_or_create_roles(session, tenant_id, [role_name])[0]
+        session.execute(
+            template_roles.delete()
+            .where(template_roles.c.template_id.in_(ids), template_roles.c.role_id == role.id)
+        )
+        session.execute(template_roles.insert(), [
+            {"template_id": template_id, "role_id": role.id, "capacity": capacity} for template_id in ids
+        ])
+        session.commit()
+    reload_templates(tenant_id)
+    return len(ids)
+
+def remove_template_role(tenant_id: int, weekdays: List[int], slot: str, role_name: str) -> int:
+    """Stop offering ``role_name`` in the slot's templates on ``weekdays``; returns the templates changed."""
+    with db_session() as session:
+        ids = _template_ids(session, tenant_id, weekdays, slot)
+        removed = session.execute(
+            template_roles.delete().where(
+                template_roles.c.template_id.in_(ids),
+                template_roles.c.role_id.in_(
+                    select(Role.id).where(Role.tenant_id == tenant_id, Role.name == role_name)
+                ),
+            )
+        ).rowcount if ids else 0
+        session.commit()
+    if removed:
+        reload_templates(tenant_id)
+    return removed
+
+def ensure_week_events(tenant_id: int, page: int = 0):
+    dates = week_dates(page)
+    state = _tenant_state(tenant_id)
+    if state.materialized.issuperset(dates):
+        return
+    with state.lock:
+        if state.materialized.issuperset(dates):
+            return
+        with db_session() as session:
+            if state.templates is None:
+                state.templates = _compile_templates(session, tenant_id)
+            in_page = (Event.tenant_id == tenant_id) & Event.date.in_(dates)
+            existing = set(session.query(Event.date, Event.slot).filter(in_page).all())
+            missing = {
+                (date, t.slot): t
+                for date in dates
+                for t in state.templates[date.weekday()]
+                if (date, t.slot) not in existing
+            }
+            if missing:
+                session.execute(
+                    insert(Event),
+                    [
+                        {"tenant_id": tenant_id, "date": date, "slot": slot, "name": t.name, "time": t.time}
+                        for (date, slot), t in missing.items()
+                    ],
+                )
+                new_rows = [
+                    ({"event_id": event_id, "role_id": role_id, "capacity": capacity}, date)
+                    for event_id, date, slot in session.query(Event.id, Event.date, Event.slot).filter(in_page)
+                    if (date, slot) in missing
+                    for role_id, capacity in missing[(date, slot)].roles
+                ]
+                if new_rows:
+                    session.execute(event_roles.insert(), [row for row, _ in new_rows])
+                    record_new_event_roles(session, tenant_id, [(date, row["role_id"]) for row, date in new_rows])
+                session.commit()
+                invalidate_week_schedule(tenant_id, min(date for date, _ in missing))
+        today = datetime.today().date()
+        state.materialized.difference_update([d for d in state.materialized if d < today])
+        state.materialized.update(dates)
+
+# Schedule pages keyed by (tenant, first date), least recently used evicted
+# first. An entry is only valid on the day it was loaded, so a write can
+# drop the one page holding its date. Writers call invalidate_week_schedule().
+_week_cache = LRUCache(SCHEDULE_CACHE_PAGES)
+_cache_lock = threading.Lock()
+_cache_generations = {}  # tenant_id -> count of writes, to spot stale loads
+_cache_stats = {"hits": 0, "misses": 0}
+
+def _cached_week(tenant_id, start):
+    today = datetime.today().date()
+    with _cache_lock:
+        entry = _week_cache.get((tenant_id, start))
+        if entry is not None and entry["day"] != today:
+            entry = None
+        _cache_stats["hits" if entry else "misses"] += 1
+        return entry, _cache_generations.get(tenant_id, 0)
+
+def _load_week(tenant_id, dates, generation):
     with db_session() as session:
-        return get_events_for_dates(session, week_dates())
\ No newline at end of file
+        view = WeekView(dates, get_events_for_dates(session, tenant_id, dates))
+        entry = {"view": view, "text": None, "cards": None, "day": datetime.today().date()}
+    with _cache_lock:
+        # Skip the store if a write invalidated the tenant's pages while we were reading.
+        if generation == _cache_generations.get(tenant_id, 0):
+            _week_cache[(tenant_id, dates[0])] = entry
+    return entry
+
+def _week_entry(tenant_id, page):
+    dates = week_dates(page)
+    entry, generation = _cached_week(tenant_id, dates[0])
+    if entry is None:
+        entry = _load_week(tenant_id, dates, generation)
+    return entry
+
+def get_week_schedule(tenant_id: int, page: int = 0) -> List[EventDTO]:
+    return _week_entry(tenant_id, page)["view"].events
+
+def get_week_view(tenant_id: int, page: int = 0) -> WeekView:
+    return _week_entry(tenant_id, page)["view"]
+
+def page_of(day) -> int:
+    return (day - datetime.today().date()).days // PAGE_DAYS
+
+def get_day_events(tenant_id: int, day) -> List[EventDTO]:
+    """Events on ``day`` (date or ISO string) from the cached page holding it."""
+    if isinstance(day, str):
+        day = datetime.fromisoformat(day).date()
+    page = page_of(day)
+    if not 0 <= page < page_count():
+        return []
+    return get_week_view(tenant_id, page).day(day.isoformat())
+
+def get_event(tenant_id: int, event_id: int, day=None) -> EventDTO:
+    """Look ``event_id`` up in the cached page for ``day``, falling back to the database."""
+    if day is not None:
+        for event in get_day_events(tenant_id, day):
+            if event.id == event_id:
+                return event
+    with db_session() as session:
+        return get_event_by_id(session, tenant_id, event_id)
+
+def get_week_schedule_text(tenant_id: int, page: int = 0) -> str:
+    from utils.formatting import build_schedule_text
+    entry = _week_entry(tenant_id, page)
+    if entry["text"] is None:
+        entry["text"] = build_schedule_text(entry["view"], markdown=False)
+    return entry["text"]
+
+def get_day_cards(tenant_id: int, page: int = 0) -> List[tuple]:
+    """(ISO date, slot summary, schedule text) for each day of the page that has events.
+
+    Built once per cached page, so they are rebuilt only after a write invalidates it.
+    """
+    from utils.formatting import build_schedule_text, get_slot_label
+    entry = _week_entry(tenant_id, page)
+    if entry["cards"] is None:
+        view = entry["view"]
+        entry["cards"] = [
+            (
+                day,
+                ", ".join(get_slot_label(e.slot, e.time) for e in view.day(day)),
+                build_schedule_text(WeekView([datetime.fromisoformat(day).date()], view.day(day))),
+            )
+            for day in view.dates
+            if view.day(day)
+        ]
+    return entry["cards"]
+
+def invalidate_week_schedule(tenant_id: int, event_date):
+    if isinstance(event_date, str):
+        event_date = datetime.fromisoformat(event_date).date()
+    page = page_of(event_date)
+    with _cache_lock:
+        _cache_generations[tenant_id] = _cache_generations.get(tenant_id, 0) + 1
+        if 0 <= page < page_count():
+            _week_cache.pop((tenant_id, week_dates(page)[0]), None)
+
+def schedule_cache_stats() -> dict:
+    with _cache_lock:
+        return dict(_cache_stats, size=len(_week_cache), evictions=_week_cache.evictions)
@@ -0,0 +1,84 @@
+import threading
+from typing import Optional
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from db.context import db_session
+from db_setup import ADMIN_IDS, DEFAULT_TENANT_ID, Tenant, tenant_admins
+from service.schedule_service import seed_default_templates
+
+# Tenant ids with their group chat ids, and their admins, loaded once by
+# load_tenants() and kept in step by the functions below, so admin checks
+# never wait on the database.
+_tenants = {DEFAULT_TENANT_ID: None}
+_admins = {}
+_lock = threading.Lock()
+
+def current_tenant(context) -> int:
+    """The tenant the user last joined with a /start link, or the default one."""
+    return context.user_data.get("tenant_id", DEFAULT_TENANT_ID)
+
+def load_tenants():
+    with db_session() as session:
+        tenants = session.execute(select(Tenant.id, Tenant.chat_id)).all()
+        rows = session.execute(select(tenant_admins.c.tenant_id, tenant_admins.c.user_id)).all()
+    admins = {}
+    for tenant_id, user_id in rows:
+        admins.setdefault(tenant_id, set()).add(user_id)
+    with _lock:
+        _tenants.update(tenants)
+        _admins.clear()
+        _admins.update(admins)
+
+def tenant_exists(tenant_id: int) -> bool:
+    return tenant_id in _tenants
+
+def tenant_chat_id(tenant_id: int) -> Optional[int]:
+    """The group chat the tenant was registered from; None for the default tenant."""
+    return _tenants.get(tenant_id)
+
+def tenant_count() -> int:
+    return len(_tenants)
+
+def get_tenant_admins(tenant_id: int) -> set:
+    admins = set(_admins.get(tenant_id, ()))
+    if tenant_id == DEFAULT_TENANT_ID:
+        admins |= ADMIN_IDS
+    return admins
+
+def is_admin(tenant_id: int, user_id: int) -> bool:
+    if tenant_id == DEFAULT_TENANT_ID and user_id in ADMIN_IDS:
+        return True
+    return user_id in _admins.get(tenant_id, ())
+
+def get_or_create_tenant(chat_id: int, title: str = None) -> int:
+    """Tenant registered for the group ``chat_id``, creating it on first use."""
+    created = False
+    with db_session() as session:
+        tenant_id = session.execute(select(Tenant.id).where(Tenant.chat_id == chat_id)).scalar()
+        if tenant_id is None:
+            try:
+                tenant_id = session.execute(
+                    insert(Tenant).values(chat_id=chat_id, title=title)
+                ).inserted_primary_key[0]
+                session.commit()
+                created = True
+            except IntegrityError:
+                session.rollback()
+                tenant_id = session.execute(select(Tenant.id).where(Tenant.chat_id == chat_id)).scalar()
+    if created:
+        seed_default_templates(tenant_id)
+    with _lock:
+        _tenants[tenant_id] = chat_id
+    return tenant_id
+
+def add_tenant_admin(tenant_id: int, user_id: int):
+    if is_admin(tenant_id, user_id):
+        return
+    with db_session() as session:
+        try:
+            session.execute(insert(tenant_admins).values(tenant_id=tenant_id, user_id=user_id))
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+    with _lock:
+        _admins.setdefault(tenant_id, set()).add(user_id)
@@ -1,5 +1,11 @@
+import re
 from telegram import KeyboardButton, ReplyKeyboardMarkup
-from db_setup import ADMIN_IDS  # Or load this from your .env as needed
+from telegram.error import TelegramError
+from db.context import run_db
+from db_setup import DEFAULT_TENANT_ID
+from service.tenants import (
+    add_tenant_admin, current_tenant, get_or_create_tenant, is_admin, tenant_chat_id, tenant_exists
+)
 
 def main_menu_keyboard(is_admin):
     kb = [
@@ -9,18 +15,66 @@ def main_menu_keyboard(is_admin):
     if is_admin:
         kb.append([KeyboardButton("Редактировать события")])
         kb.append([KeyboardButton("Отмена")])
-    return ReplyKeyboardMarkup(kb, one_time_keyboard=True, resize_keyboard=True)
+    return ReplyKeyboardMarkup(kb, resize_keyboard=True)
+
+def main_menu_markup(update, context):
+    # The reply keyboard stays visible once sent, so only attach it when the
+    # chat is not already showing this variant of it.
+    admin = is_admin(current_tenant(context), update.effective_user.id)
+    if context.chat_data.get("menu_keyboard") == admin:
+        return None
+    context.chat_data["menu_keyboard"] = admin
+    return main_menu_keyboard(admin)
 
 async def show_main_menu(update, context):
-    is_admin = update.effective_user.id in ADMIN_IDS
-    await update.effective_chat.send_message(
-        "Меню:",
-        reply_markup=main_menu_keyboard(is_admin)
+    markup = main_menu_markup(update, context)
+    if markup:
+        await update.effective_chat.send_message("Меню:", reply_markup=markup)
+
+async def register_group(update, context):
+    # /start in a group: a group admin connects it as a tenant and gets the join link.
+    chat, user = update.effective_chat, update.effective_user
+    member = await context.bot.get_chat_member(chat.id, user.id)
+    if member.status not in ("creator", "administrator"):
+        await update.message.reply_text("Подключить бота может только администратор группы.")
+        return
+    tenant_id = await run_db(get_or_create_tenant, chat.id, chat.title)
+    await run_db(add_tenant_admin, tenant_id, user.id)
+    await update.message.reply_text(
+        "Группа подключена. Участникам — открыть бота по ссылке:\n"
+        f"https://t.me/{context.bot.username}?start=g{tenant_id}"
     )
 
+async def is_group_member(bot, tenant_id: int, user_id: int) -> bool:
+    # Tenant ids in join links are sequential, so a link alone proves nothing:
+    # only members of the tenant's group may switch to it.
+    if tenant_id == DEFAULT_TENANT_ID:
+        return True
+    chat_id = tenant_chat_id(tenant_id)
+    if chat_id is None:
+        return False
+    try:
+        member = await bot.get_chat_member(chat_id, user_id)
+    except TelegramError:
+        return False
+    if member.status == "restricted":
+        return member.is_member
+    return member.status in ("creator", "administrator", "member")
+
 async def start(update, context):
-    is_admin = update.effective_user.id in ADMIN_IDS
+    if update.effective_chat.type in ("group", "supergroup"):
+        return await register_group(update, context)
+    # /start g<id> from a group's join link switches the user to that group.
+    match = re.fullmatch(r"g(\d+)", context.args[0]) if context.args else None
+    if match and tenant_exists(int(match.group(1))):
+        tenant_id = int(match.group(1))
+        if await is_group_member(context.bot, tenant_id, update.effective_user.id):
+            context.user_data["tenant_id"] = tenant_id
+        else:
+            await update.message.reply_text("Эта ссылка открывает расписание только участникам группы.")
+    admin = is_admin(current_tenant(context), update.effective_user.id)
+    context.chat_data["menu_keyboard"] = admin
     await update.message.reply_text(
         "Добро пожаловать! Для просмотра расписания или записи используйте кнопки ниже:",
-        reply_markup=main_menu_keyboard(is_admin)
+        reply_markup=main_menu_keyboard(admin)
     )
\ No newline at end of file
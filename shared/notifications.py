@@ -1,13 +1,74 @@
 import os
+import asyncio
 import logging
+from service.tenants import get_tenant_admins
+from utils.formatting import MAX_MESSAGE_LENGTH
 
-# It's best to directly load ADMIN_IDS here so it's always up-to-date
-ADMIN_IDS = set(int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip())
+# Telegram allows ~30 messages per second overall and ~1 per second to a single chat.
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_CHAT_INTERVAL = float(os.getenv("NOTIFY_CHAT_INTERVAL", "1.0"))
 logger = logging.getLogger(__name__)
 
-async def notify_admins(context, text: str):
-    for admin_id in ADMIN_IDS:
-        try:
-            await context.bot.send_message(admin_id, text)
-        except Exception as e:
-            logger.warning(f"Failed to notify admin {admin_id}: {e}")
\ No newline at end of file
+class RateLimiter:
+    """Hands out send slots that respect a global rate and a per-chat interval."""
+
+    def __init__(self, global_rate: float, chat_interval: float):
+        self.global_interval = 1.0 / global_rate
+        self.chat_interval = chat_interval
+        self._next_global = 0.0
+        self._next_chat = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, chat_id):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+            self._next_global = slot + self.global_interval
+            self._next_chat[chat_id] = slot + self.chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+_limiter = None
+_pending = set()
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_INTERVAL)
+    return _limiter
+
+async def _send(bot, admin_id, text: str):
+    await get_rate_limiter().wait(admin_id)
+    try:
+        await bot.send_message(admin_id, text)
+    except Exception as e:
+        logger.warning(f"Failed to notify admin {admin_id}: {e}")
+
+def _coalesce(texts):
+    messages = []
+    for text in texts:
+        if messages and len(messages[-1]) + 2 + len(text) <= MAX_MESSAGE_LENGTH:
+            messages[-1] += "\n\n" + text
+        else:
+            messages.append(text)
+    return messages
+
+async def notify_admins(context, tenant_id: int, *texts: str):
+    """Queue ``texts`` for every admin of the tenant, combined into as few messages as possible.
+
+    Returns without waiting for delivery; sends go out concurrently under the rate limiter.
+    """
+    admin_ids = get_tenant_admins(tenant_id)
+    if not admin_ids:
+        return
+    for text in _coalesce(texts):
+        for admin_id in admin_ids:
+            task = asyncio.create_task(_send(context.bot, admin_id, text))
+            _pending.add(task)
+            task.add_done_callback(_pending.discard)
+
+async def flush_notifications():
+    """Wait until every queued admin notification has been sent."""
+    while _pending:
+        await asyncio.gather(*list(_pending))
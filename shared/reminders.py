@@ -0,0 +1,140 @@
+import os
+import heapq
+import asyncio
+import logging
+import itertools
+from datetime import datetime, timedelta
+from db.context import run_query
+from db.queries import get_reminder_rows
+from shared.notifications import get_rate_limiter
+from utils.formatting import ru_date_string
+from utils.times import event_start
+
+# Minutes before an event its participants are reminded; 0 disables reminders.
+REMINDER_LEAD_MINUTES = int(os.getenv("REMINDER_LEAD_MINUTES", "120"))
+REMINDER_TICK = float(os.getenv("REMINDER_TICK", "30"))  # seconds between due checks
+REMINDER_BATCH = int(os.getenv("REMINDER_BATCH", "50"))  # reminders sent at once
+logger = logging.getLogger(__name__)
+
+# Pending reminders live in one heap ordered by send time. Entries are keyed by
+# (event_id, role_id, username); cancelling or rescheduling only updates
+# _pending, and heap entries that no longer match it are dropped when popped.
+_heap = []
+_pending = {}  # key -> (remind_at, chat_id, role name)
+_by_event = {}  # event_id -> set of keys
+_events = {}  # event_id -> [date, time, name]
+_seq = itertools.count()
+
+def _push(key, remind_at, chat_id, role):
+    _pending[key] = (remind_at, chat_id, role)
+    _by_event.setdefault(key[0], set()).add(key)
+    heapq.heappush(_heap, (remind_at, next(_seq), key))
+
+def _discard(key):
+    _pending.pop(key, None)
+    keys = _by_event.get(key[0])
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            del _by_event[key[0]]
+            _events.pop(key[0], None)
+    # Drop stale heap entries once they outnumber live ones.
+    if len(_heap) > 2 * len(_pending) + 64:
+        _heap[:] = [entry for entry in _heap if _pending.get(entry[2], (None,))[0] == entry[0]]
+        heapq.heapify(_heap)
+
+def schedule_reminder(event, role_id, role, username, chat_id):
+    """Queue a reminder for a new signup to ``event`` (an EventDTO)."""
+    start = event_start(event.date, event.time)
+    if not REMINDER_LEAD_MINUTES or start is None or start <= datetime.now():
+        return
+    _events[event.id] = [event.date, event.time, event.name]
+    _push((event.id, role_id, username), start - timedelta(minutes=REMINDER_LEAD_MINUTES), chat_id, role)
+
+def cancel_reminder(event_id, role_id, username):
+    _discard((event_id, role_id, username))
+
+def reschedule_event(event_id, new_time: str):
+    """Move the pending reminders of ``event_id`` after its time was changed."""
+    keys = _by_event.get(event_id)
+    if not keys:
+        return
+    info = _events[event_id]
+    info[1] = new_time
+    start = event_start(info[0], new_time)
+    for key in list(keys):
+        if start is None:
+            _discard(key)
+        else:
+            _, chat_id, role = _pending[key]
+            _push(key, start - timedelta(minutes=REMINDER_LEAD_MINUTES), chat_id, role)
+
+async def load_reminders():
+    """Fill the heap with reminders for upcoming signups that are not yet due."""
+    now = datetime.now()
+    rows = await run_query(get_reminder_rows, now.date())
+    _heap.clear()
+    _pending.clear()
+    _by_event.clear()
+    _events.clear()
+    for event_id, day, event_time, name, role_id, role, username, chat_id in rows:
+        start = event_start(day, event_time)
+        if start is None:
+            continue
+        remind_at = start - timedelta(minutes=REMINDER_LEAD_MINUTES)
+        # Reminders that fell due while the bot was down are not sent late.
+        if remind_at <= now:
+            continue
+        _events[event_id] = [day, event_time, name]
+        key = (event_id, role_id, username)
+        _pending[key] = (remind_at, chat_id, role)
+        _by_event.setdefault(event_id, set()).add(key)
+        _heap.append((remind_at, next(_seq), key))
+    heapq.heapify(_heap)
+
+def _pop_due(now):
+    due = []
+    while _heap and _heap[0][0] <= now:
+        remind_at, _, key = heapq.heappop(_heap)
+        entry = _pending.get(key)
+        if entry is None or entry[0] != remind_at:
+            continue
+        event = _events[key[0]]
+        _discard(key)
+        due.append((entry[1], event, entry[2]))
+    return due
+
+async def _send_reminder(bot, chat_id, event, role):
+    day, event_time, name = event
+    await get_rate_limiter().wait(chat_id)
+    try:
+        await bot.send_message(
+            chat_id,
+            f"⏰ Напоминание: {name}\n"
+            f"{ru_date_string(day)}, {event_time}\n"
+            f"Роль: {role or 'Без роли'}",
+        )
+    except Exception as e:
+        logger.warning(f"Failed to send reminder to {chat_id}: {e}")
+
+async def send_due_reminders(context):
+    """Job queue callback: send every reminder that is due, REMINDER_BATCH at a time."""
+    due = _pop_due(datetime.now())
+    for i in range(0, len(due), REMINDER_BATCH):
+        await asyncio.gather(*(
+            _send_reminder(context.bot, chat_id, event, role)
+            for chat_id, event, role in due[i:i + REMINDER_BATCH]
+        ))
+
+def pending_reminders() -> int:
+    return len(_pending)
+
+async def start_reminders(app):
+    if not REMINDER_LEAD_MINUTES:
+        return
+    if app.job_queue is None:
+        logger.warning("Reminders need python-telegram-bot[job-queue]; not scheduling them")
+        return
+    await load_reminders()
+    app.job_queue.run_repeating(send_due_reminders, interval=REMINDER_TICK, first=REMINDER_TICK)
+    logger.info("Loaded %d pending reminders", len(_pending))
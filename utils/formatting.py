@@ -1,6 +1,6 @@
 import re
+from functools import lru_cache
 from datetime import datetime, date as dt_date
-from service.schedule_service import week_dates
 
 WEEKDAY_RU = {
     0: "Понедельник",
@@ -15,6 +15,8 @@ MONTH_RU = {
     1: "янв", 2: "фев", 3: "мар", 4: "апр", 5: "мая", 6: "июн",
     7: "июл", 8: "авг", 9: "сен", 10: "окт", 11: "ноя", 12: "дек",
 }
+# Longest text Telegram accepts in one message.
+MAX_MESSAGE_LENGTH = 4096
 SLOT_RU = {
     "morning": "Утро",
     "evening": "Вечер",
@@ -23,6 +25,13 @@ SLOT_RU = {
 def get_slot_label(slot, time):
     return f"{SLOT_RU.get(slot, slot)} ({time})"
 
+def get_role_label(event, role):
+    seats = event.seats_left(role.id)
+    if seats is None:
+        return role.name
+    return f"{role.name} (мест: {seats})" if seats else f"{role.name} (мест нет)"
+
+@lru_cache(maxsize=1024)
 def ru_date_string(date_input) -> str:
     if isinstance(date_input, dt_date):
         date_obj = date_input
@@ -34,36 +43,24 @@ def ru_date_string(date_input) -> str:
     return f"{weekday}, {day} {month}"
 
 def escape_username_md2(username: str) -> str:
-    import re
     return re.sub(r'([_*\[\]()~`>#+\-=|{}.!])', r'\\\1', username)
 
-def build_schedule_text(event_dtos, markdown=False):
+def build_schedule_text(view, markdown=False):
     lines = []
-    dates = week_dates()
-    events_by_date = {date: [] for date in dates}
-    for event in event_dtos:
-        event_date = datetime.fromisoformat(event.date).date()
-        events_by_date[event_date].append(event)
-
-    for date in dates:
+    for date in view.dates:
         day_lines = []
-        for slot in ["morning", "evening"]:
-            event = next((e for e in events_by_date[date] if e.slot == slot), None)
-            if event:
-                if event.participations:
-                    part_lines = [
-                        f"      - @{escape_username_md2(p.username) if markdown else p.username}: {p.role.name if p.role else 'Без роли'}"
-                        for p in event.participations
-                    ]
-                    participants_text = "\n".join(part_lines)
-                    day_lines.append(
-                        f"  - {SLOT_RU[slot]} ({event.time}):\n{participants_text}"
-                    )
-                else:
-                    day_lines.append(
-                        f"  - {SLOT_RU[slot]} ({event.time})"
-                    )
+        for event in view.day(date):
+            label = get_slot_label(event.slot, event.time)
+            if event.participations:
+                part_lines = [
+                    f"      - @{escape_username_md2(p.username) if markdown else p.username}: {p.role.name if p.role else 'Без роли'}"
+                    for p in event.participations
+                ]
+                participants_text = "\n".join(part_lines)
+                day_lines.append(f"  - {label}:\n{participants_text}")
+            else:
+                day_lines.append(f"  - {label}")
         if day_lines:
-            lines.append(ru_date_string(date.isoformat()))
+            lines.append(ru_date_string(date))
             lines.extend(day_lines)
     return "\n".join(lines) if lines else "Нет событий на ближайшие 7 дней."
\ No newline at end of file
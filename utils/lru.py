@@ -0,0 +1,37 @@
+from collections import OrderedDict
+
+class LRUCache:
+    """Mapping that drops its least recently used keys beyond ``maxsize``.
+
+    Not thread-safe; callers hold their own lock around it.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+import threading
+from contextvars import ContextVar
+
+METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "300"))  # seconds, 0 disables
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # local JSON endpoint, 0 disables
+# A single handler call issuing more statements than this is logged as a likely N+1.
+METRICS_SQL_WARN = int(os.getenv("METRICS_SQL_WARN", "20"))
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar("metrics_handler_call", default=None)
+_lock = threading.Lock()
+_handlers = {}
+
+class _HandlerStats:
+    __slots__ = ("calls", "total_ms", "buckets", "sql_count", "sql_ms", "sessions", "api_calls")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.sessions = 0
+        self.api_calls = {}
+
+class _Call:
+    """Per-invocation counters; rolled into _HandlerStats when the handler returns."""
+    __slots__ = ("name", "sql_count", "sql_ms", "sessions", "api_calls")
+
+    def __init__(self, name):
+        self.name = name
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.sessions = 0
+        self.api_calls = {}
+
+def _stats(name) -> _HandlerStats:
+    stats = _handlers.get(name)
+    if stats is None:
+        stats = _handlers[name] = _HandlerStats()
+    return stats
+
+def _finish(call: _Call, elapsed_ms: float):
+    with _lock:
+        stats = _stats(call.name)
+        stats.calls += 1
+        stats.total_ms += elapsed_ms
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound), -1)
+        stats.buckets[bucket] += 1
+        stats.sql_count += call.sql_count
+        stats.sql_ms += call.sql_ms
+        stats.sessions += call.sessions
+        for method, count in call.api_calls.items():
+            stats.api_calls[method] = stats.api_calls.get(method, 0) + count
+    if call.sql_count > METRICS_SQL_WARN:
+        logger.warning("%s issued %d SQL statements in one call", call.name, call.sql_count)
+
+def instrument_callback(callback):
+    if getattr(callback, "_instrumented", False):
+        return callback
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        call = _Call(callback.__name__)
+        token = _current.set(call)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            _current.reset(token)
+            _finish(call, (time.perf_counter() - started) * 1000)
+
+    wrapper._instrumented = True
+    return wrapper
+
+def _instrument_handler(handler):
+    from telegram.ext import ConversationHandler
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for inner in nested:
+            _instrument_handler(inner)
+    else:
+        handler.callback = instrument_callback(handler.callback)
+
+def instrument_application(app):
+    """Wrap the callback of every registered handler, including conversation states."""
+    for group in app.handlers.values():
+        for handler in group:
+            _instrument_handler(handler)
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    # The start time lives on the execution context, which is dropped with it
+    # when a statement fails and after_cursor_execute never runs.
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = context._metrics_started
+        call = _current.get()
+        if call is not None:
+            call.sql_count += 1
+            call.sql_ms += (time.perf_counter() - started) * 1000
+
+def record_session():
+    call = _current.get()
+    if call is not None:
+        call.sessions += 1
+
+def record_api_call(url: str):
+    call = _current.get()
+    if call is not None:
+        endpoint = url.rsplit("/", 1)[-1]
+        call.api_calls[endpoint] = call.api_calls.get(endpoint, 0) + 1
+
+def snapshot() -> dict:
+    from service.schedule_service import schedule_cache_stats
+    with _lock:
+        handlers = {
+            name: {
+                "calls": s.calls,
+                "avg_ms": round(s.total_ms / s.calls, 2) if s.calls else 0.0,
+                "latency_ms": dict(
+                    zip([f"le_{b}" for b in LATENCY_BUCKETS_MS] + ["inf"], s.buckets)
+                ),
+                "sql_per_call": round(s.sql_count / s.calls, 2) if s.calls else 0.0,
+                "sql_ms_per_call": round(s.sql_ms / s.calls, 2) if s.calls else 0.0,
+                "sessions_per_call": round(s.sessions / s.calls, 2) if s.calls else 0.0,
+                "api_calls": dict(s.api_calls),
+            }
+            for name, s in _handlers.items()
+        }
+    return {"handlers": handlers, "schedule_cache": schedule_cache_stats()}
+
+async def _log_periodically():
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        logger.info("metrics %s", json.dumps(snapshot(), ensure_ascii=False))
+
+async def _serve_metrics(reader, writer):
+    await reader.readuntil(b"\r\n\r\n")
+    body = json.dumps(snapshot(), ensure_ascii=False, indent=2).encode()
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json; charset=utf-8\r\n"
+        + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    writer.close()
+
+_log_task = None
+_server = None
+
+async def start_reporting():
+    """Start the periodic log dump and the local metrics endpoint, as configured."""
+    global _log_task, _server
+    if METRICS_LOG_INTERVAL > 0:
+        _log_task = asyncio.create_task(_log_periodically())
+    if METRICS_PORT:
+        _server = await asyncio.start_server(_serve_metrics, "127.0.0.1", METRICS_PORT)
+        logger.info("Serving metrics on http://127.0.0.1:%d/", METRICS_PORT)
+
+async def stop_reporting():
+    global _log_task, _server
+    if _log_task:
+        _log_task.cancel()
+        _log_task = None
+    if _server:
+        _server.close()
+        _server = None
@@ -0,0 +1,24 @@
+import re
+from datetime import date, datetime, time
+from typing import Optional
+
+TIME_RE = re.compile(r"(\d{1,2}):(\d{2})")
+
+def parse_time(text: str) -> Optional[str]:
+    """``text`` as a zero-padded "HH:MM" if it is a valid time of day ("8:05" -> "08:05"), else None."""
+    match = TIME_RE.fullmatch(text.strip())
+    if not match:
+        return None
+    hour, minute = int(match[1]), int(match[2])
+    if hour > 23 or minute > 59:
+        return None
+    return f"{hour:02d}:{minute:02d}"
+
+def event_start(day, event_time: str) -> Optional[datetime]:
+    """When an event on ``day`` (a date or ISO string) at ``event_time`` starts; None if the time is not valid."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    event_time = parse_time(event_time)
+    if event_time is None:
+        return None
+    return datetime.combine(day, time.fromisoformat(event_time))